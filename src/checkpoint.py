@@ -0,0 +1,74 @@
+import os
+import json
+import time
+from loguru import logger
+
+
+class StateFile:
+    """A JSON state file, replaced atomically so a killed campaign never leaves a torn checkpoint behind."""
+
+    def __init__(self, path: str, interval: float):
+        self.path = path
+        self.interval = interval
+        self.saved = time.time()
+
+    def load(self):
+        """The saved state, None if there is none."""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, state, force: bool = False):
+        """Writes the state if interval seconds have passed since the last save, or if force is set."""
+        if not force and time.time() - self.saved < self.interval:
+            return False
+        self.saved = time.time()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f'Failed to write checkpoint {self.path}: {e}')
+            return False
+        return True
+
+
+class Progress:
+    """
+    The loop indices a campaign has finished. Loops are handed out in stride slices (loop - 1) % stride, one
+    per worker or producer, that each finish in order up to the queued cases, so every slice is kept as the
+    last loop up to which it is done and the few loops finished past it.
+    """
+
+    def __init__(self, stride: int, lows: list = None, done: list = None, crashed: list = None):
+        self.stride = max(1, stride)
+        # the loop before the first one of every slice
+        self.lows = list(lows) if lows is not None else [r + 1 - self.stride for r in range(self.stride)]
+        self.done = set(done or [])
+        # loops whose worker crashed, skipped on resume and replayed with --replay instead
+        self.crashed = list(crashed or [])
+
+    def is_done(self, loop: int):
+        return loop <= self.lows[(loop - 1) % self.stride] or loop in self.done
+
+    def add(self, loop: int, crashed: bool = False):
+        if crashed:
+            self.crashed.append(loop)
+        r = (loop - 1) % self.stride
+        self.done.add(loop)
+        while self.lows[r] + self.stride in self.done:
+            self.lows[r] += self.stride
+            self.done.remove(self.lows[r])
+
+    def count(self):
+        return sum((low + self.stride - r - 1) // self.stride for r, low in enumerate(self.lows)) + len(self.done)
+
+    def state(self):
+        return {'stride': self.stride, 'lows': self.lows, 'done': sorted(self.done), 'crashed': self.crashed}
+
+    @staticmethod
+    def from_state(state: dict):
+        return Progress(state['stride'], state['lows'], state['done'], state['crashed'])
@@ -4,4 +4,48 @@ seed = int(time.time())
 max_loop = 10000000
 test_column_cnt = 2
 other_column_cnt = 2
-select_cnt = 50
\ No newline at end of file
+select_cnt = 50
+# number of select pairs sent in one request with --pair-mode batch
+batch_pairs = 10
+# number of generated cases waiting for the workers with --producers, producers block while the queue is full
+case_queue_size = 32
+schema_pool_size = 2
+# time budget of every statement in seconds (0 for none), enforced by the server where it has a limit for it and by
+# cancelling the statement from another thread otherwise; a statement past it gets a timeout result
+statement_timeout = 10
+insert_batch_size = 16
+# the original table gets 2 to max_row_cnt + 1 random rows
+max_row_cnt = 30
+validity_cache = '../cache/validity.db'
+validity_min_failures = 3
+# derived column types seen by the workers, used by the case producers as type hints
+derived_type_cache = '../cache/derived_types.db'
+# 'digest' compares select results by row count and digest, 'rows' also keeps the rows of every result
+compare_mode = 'digest'
+# a select pair with equal results is timed again latency_runs times if one select took latency_ratio times as long as
+# the other and latency_min_seconds at least, and reported if the fastest runs still differ as much (0 disables it)
+latency_ratio = 10
+latency_min_seconds = 0.05
+latency_runs = 5
+# signatures of the findings of all runs, only the first finding of a signature is written in full
+signature_index = '../cache/signatures.db'
+# metrics of the running campaign in the Prometheus text format, rewritten every metrics_interval seconds
+metrics_path = '../log/{target}/metrics.prom'
+metrics_interval = 10
+# number of ops of the same type tested per iteration, each precomputed into its own column of the derived table
+# (1 tests one op per iteration, e.g. 4 sets the tables up once for four ops)
+exprs_per_table = 1
+# number of populated original tables kept for reuse by iterations with the same column types
+# (0 builds the tables of every iteration from scratch, e.g. 8 turns the reuse on)
+fixture_cache_size = 0
+# 'bandit' shifts the choice of op types, ops and column types toward those that yielded valid pairs and
+# discrepancies, 'uniform' picks them uniformly at random
+scheduler = 'bandit'
+# weight kept by the past outcomes at every update, and share of the picks made uniformly at random
+scheduler_decay = 0.999
+scheduler_floor = 0.1
+# reward of a test that compared all its pairs without a discrepancy, a discrepancy is worth 1
+scheduler_pass_reward = 0.2
+# campaign checkpoints (finished loops, seed and scheduler state), rewritten every checkpoint_interval seconds
+checkpoint_path = '../cache/checkpoint/{target}'
+checkpoint_interval = 30
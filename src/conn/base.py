@@ -1,10 +1,90 @@
+import json
+import time
+import decimal
+import hashlib
+import datetime
 from enum import Enum
 from loguru import logger
 from abc import abstractmethod
+from contextlib import contextmanager
+from conn.watchdog import Watchdog
+
+
+DIGEST_MASK = (1 << 128) - 1
+
+
+################# result normalization #################
+def _to_integral(col):
+    s = str(col)
+    return s if 'e' in s or 'E' in s else int(col)
+
+
+def convert_value(col):
+    """Normalizes a single value of unknown type, the fallback of every column converter."""
+    if isinstance(col, (bytes, bytearray)):
+        return col.hex()
+    elif isinstance(col, float):
+        return _to_integral(col) if col.is_integer() else str(col)
+    elif isinstance(col, decimal.Decimal):
+        return _to_integral(col) if float(col).is_integer() else str(col)
+    elif isinstance(col, dict):
+        return json.dumps(col)
+    elif isinstance(col, list):
+        return sorted(col)
+    else:
+        return str(col)
+
+
+def _guarded(types, convert):
+    # the metadata only tells what a column should hold, values of any other type (e.g. NULL) use convert_value
+    def converter(col):
+        if isinstance(col, types):
+            return convert(col)
+        return convert_value(col)
+    return converter
+
+
+# column kind -> converter, columns of unknown kind use convert_value
+CONVERTERS = {
+    'int': _guarded(int, str),
+    'float': _guarded(float, lambda col: _to_integral(col) if col.is_integer() else str(col)),
+    'decimal': _guarded(decimal.Decimal, lambda col: _to_integral(col) if float(col).is_integer() else str(col)),
+    'str': _guarded(str, str),
+    'bytes': _guarded((bytes, bytearray), lambda col: col.hex()),
+    'temporal': _guarded((datetime.date, datetime.time, datetime.timedelta), str),
+    'json': _guarded(dict, json.dumps),
+    'list': _guarded(list, sorted),
+}
+
+
+class RowConverter:
+    """
+    Converts result rows to the strings compared by Result. The converter of every column is picked once
+    per result set from the column kinds reported by the connector, then applied row by row.
+    """
+
+    def __init__(self, column_kinds: list):
+        self.converters = [CONVERTERS.get(kind, convert_value) for kind in column_kinds]
+
+    def __call__(self, row):
+        return ' * '.join([str(convert(col)) for convert, col in zip(self.converters, row)])
+
+    def convert(self, rows):
+        return map(self, rows)
 
 
 class Connection:
-    def __init__(self, user: str, password: str, host: str, port: int, database: str, res_blacklist: list):
+    create_database_sql = 'CREATE DATABASE {}'
+    drop_database_sql = 'DROP DATABASE IF EXISTS {}'
+    admin_database = 'test'
+    version_sql = 'SELECT VERSION()'
+    # whether cancel can stop the running statement of the session from another thread
+    cancellable = False
+    # seconds the watchdog leaves a server that enforces the time budget itself before cancelling the statement
+    watchdog_grace = 1.0
+
+    def __init__(self, user: str, password: str, host: str, port: int, database: str, res_blacklist: list,
+                 admin=None, create_database: bool = True, statement_timeout: float = 0):
         self.config = {
             'user': user,
             'password': password,
@@ -12,50 +92,194 @@ class Connection:
             'database': database,
             'port': port,
         }
-        self.conn = self.create_conn(self.config)
         self.res_blacklist = res_blacklist
+        self.admin = admin
+        self.peer = None
+        self.owns_database = create_database
+        # time budget of every statement in seconds, 0 for none
+        self.statement_timeout = statement_timeout
+        self.watchdog = None
+        if create_database:
+            self.recreate_database()
+        self.conn = self.create_conn(self.config)
+        if statement_timeout > 0:
+            limited = self.limit_statement_time()
+            if self.cancellable:
+                self.watchdog = Watchdog(statement_timeout + (self.watchdog_grace if limited else 0), self.cancel)
+
+    @classmethod
+    def open_admin(cls, user: str, password: str, host: str, port: int, res_blacklist: list, statement_timeout: float = 0):
+        """Opens a session on the admin database, which is used to create and drop the test databases. It has no time budget."""
+        return cls(user, password, host, port, cls.admin_database, res_blacklist, create_database=False)
+
+    def _admin_session(self):
+        if self.admin is not None:
+            return self.admin
+        return self.open_admin(self.config['user'], self.config['password'], self.config['host'],
+                               self.config['port'], self.res_blacklist)
+
+    def _run_admin(self, sqls: list, action: str):
+        admin = self._admin_session()
+        try:
+            for sql in sqls:
+                res = admin.execute(sql)
+                if res.is_error():
+                    logger.error('{} database {} failed, reason: {}', action, self.config['database'], res.error_msg)
+                    break
+        finally:
+            if admin is not self.admin:
+                admin.close()
+
+    def recreate_database(self):
+        database = self.config['database']
+        self._run_admin([self.drop_database_sql.format(database), self.create_database_sql.format(database)], 'Create')
 
     @abstractmethod
     def create_conn(self, config: dict):
         pass
 
     @abstractmethod
-    def execute(self, sql: str):
+    def execute(self, sql: str, keep_rows: bool = True):
         pass
 
-    @abstractmethod
-    def clean(self):
+    def execute_batch(self, sqls: list, keep_rows: bool = True):
+        """
+        Executes the statements in order and returns one result per statement. Connectors whose protocol can
+        carry several statements in one request override this to save the round trips.
+        """
+        return [self.execute_timed(sql, keep_rows) for sql in sqls]
+
+    def execute_timed(self, sql: str, keep_rows: bool = True):
+        """Like execute, also recording the wall time of the statement, fetching included, in the result."""
+        start = time.perf_counter()
+        res = self.execute(sql, keep_rows)
+        res.elapsed = time.perf_counter() - start
+        return res
+
+    def get_peer(self):
+        """Returns a second session on the same database, used to run two statements at the same time."""
+        if self.peer is None:
+            self.peer = self.__class__(self.config['user'], self.config['password'], self.config['host'],
+                                       self.config['port'], self.config['database'], self.res_blacklist,
+                                       admin=self.admin, create_database=False, statement_timeout=self.statement_timeout)
+        return self.peer
+
+    def limit_statement_time(self):
+        """
+        Sets the server-side time limit of the session to statement_timeout, called again whenever the session state
+        is reset. Returns whether the server enforces it, the watchdog then leaves it watchdog_grace seconds to do so.
+        """
+        return False
+
+    def cancel(self):
+        """Stops the running statement of the session, called by the watchdog from its own thread."""
         pass
 
+    def is_timeout(self, e: Exception):
+        """Whether the error is a statement stopped by the server-side time limit or by cancel."""
+        return False
+
+    @contextmanager
+    def watch(self):
+        """Runs a statement under the watchdog, if the session has one."""
+        if self.watchdog is None:
+            yield
+            return
+        self.watchdog.start()
+        try:
+            yield
+        finally:
+            self.watchdog.stop()
+
+    def commit(self):
+        """Makes the changes of this session visible to other sessions such as the peer."""
+        self.conn.commit()
+
+    def error_message(self, e: Exception):
+        return repr(e)
+
+    def error_code(self, e: Exception):
+        return None
+
+    def error_result(self, sql: str, e: Exception):
+        """Builds the result of a failed statement, flagging the errors in the blacklist of the target."""
+        error_msg = self.error_message(e)
+        if self.is_timeout(e) or (self.watchdog is not None and self.watchdog.fired):
+            return Result(sql=sql, error_msg=error_msg, error_code=self.error_code(e), timeout=self.statement_timeout)
+        blacklisted = any(blacklisted in error_msg.upper() for blacklisted in self.res_blacklist)
+        return Result(sql=sql, error_msg=error_msg, blacklisted=blacklisted, error_code=self.error_code(e))
+
+    def server_version(self):
+        res = self.execute(self.version_sql)
+        return res.sorted_res[0] if res.sorted_res else 'unknown'
+
+    def reset_session(self):
+        """Restores the session state (e.g. variables changed by SET statements) of a recycled connection."""
+        pass
+
+    def reset(self, tables=('t0', 't1')):
+        """Prepares the database for the next iteration by dropping only the tables used by the test."""
+        res = [self.execute(f'DROP TABLE IF EXISTS {table}') for table in tables]
+        self.reset_session()
+        if self.peer is not None:
+            self.peer.reset_session()
+        return not any(r.is_error() for r in res)
+
+    def clean(self):
+        self._run_admin([self.drop_database_sql.format(self.config['database'])], 'Clean')
+
     def close(self):
         try:
+            if self.watchdog is not None:
+                self.watchdog.close()
+            if self.peer is not None:
+                self.peer.close()
             self.conn.close()
-            self.clean()
+            if self.owns_database:
+                self.clean()
         except Exception as e:
             logger.error('Connection closed failed, reason: {}', e)
 
 
 class Result:
+    __slots__ = ('sql', 'type', 'update_num', 'row_cnt', 'digest', 'rows', '_sorted_res', 'error', 'error_msg',
+                 'error_code', 'blacklisted', 'column_types', 'elapsed')
+
     class __ResultType(Enum):
         DEFAULT = 0
         ERROR = 1
         RESULT = 2
         UPDATE = 3
+        TIMEOUT = 4
 
-    def __init__(self, sql, error_msg=None, update_num=None, res=None, blacklisted=False):
+    def __init__(self, sql, error_msg=None, update_num=None, res=None, blacklisted=False, column_types=None,
+                 error_code=None, keep_rows=True, timeout=None):
+        """
+        res is an iterable of rows (already converted to strings) that is consumed as it streams in: the
+        row count and an order-insensitive digest of the rows are always computed, the rows themselves are
+        only kept if keep_rows is set. timeout is the time budget in seconds of a statement that ran past it.
+        """
         self.sql = sql
         self.type = self.__ResultType.DEFAULT
         self.update_num = None
-        self.sorted_res = []
+        self.row_cnt = 0
+        self.digest = 0
+        self.rows = None
+        self._sorted_res = None
         self.error = None
         self.error_msg = None
+        self.error_code = None
         self.blacklisted = blacklisted
+        # type names of the result columns taken from the result metadata, None where the connector cannot tell
+        self.column_types = column_types or []
+        # wall time of the statement in seconds, None if it was not timed
+        self.elapsed = None
 
         if update_num is not None:
             self.update_num = update_num
             self.type = self.__ResultType.UPDATE
         elif res is not None:
-            self.sorted_res = sorted(res)
+            self._consume(res, keep_rows)
             self.type = self.__ResultType.RESULT
         if error_msg is not None:
             if "(" in error_msg:
@@ -63,18 +287,61 @@ class Result:
             else:
                 self.error = ''
             self.error_msg = error_msg
+            self.error_code = None if error_code is None else str(error_code)
             self.type = self.__ResultType.ERROR
+        if timeout is not None:
+            self.error = 'timeout'
+            self.error_msg = f'statement ran past {timeout}s: {error_msg}'
+            self.error_code = 'timeout'
+            self.type = self.__ResultType.TIMEOUT
+
+    def _consume(self, res, keep_rows: bool):
+        # the digest of a multiset of rows is the sum of the row hashes, which does not depend on the row order
+        digest, row_cnt = 0, 0
+        rows = [] if keep_rows else None
+        for row in res:
+            digest += int.from_bytes(hashlib.blake2b(row.encode('utf-8', 'surrogatepass'), digest_size=16).digest(), 'big')
+            row_cnt += 1
+            if keep_rows:
+                rows.append(row)
+        self.digest = digest & DIGEST_MASK
+        self.row_cnt = row_cnt
+        self.rows = rows
+
+    @property
+    def sorted_res(self):
+        """The sorted rows, sorted on first use; empty if the rows were not kept."""
+        if self._sorted_res is None:
+            self._sorted_res = sorted(self.rows) if self.rows else []
+        return self._sorted_res
+
+    def compact(self):
+        """Drops the rows and metadata, keeping the SQL, row count and digest needed to compare and log the result."""
+        self.rows = None
+        self._sorted_res = None
+        self.column_types = []
+
+    def has_rows(self):
+        return self.type != self.__ResultType.RESULT or self.rows is not None
 
     def is_error(self):
-        return self.type == self.__ResultType.ERROR
+        """Whether the statement failed, a timed out statement included."""
+        return self.type in [self.__ResultType.ERROR, self.__ResultType.TIMEOUT]
+
+    def is_timeout(self):
+        return self.type == self.__ResultType.TIMEOUT
 
     def get_res(self):
         if self.type == self.__ResultType.ERROR:
             return [f"-- error: {self.error}, message: {self.error_msg}"]
+        elif self.type == self.__ResultType.TIMEOUT:
+            return [f"-- timeout: {self.error_msg}"]
         elif self.type == self.__ResultType.UPDATE:
             return [f"-- update: {self.update_num}"]
         elif self.type == self.__ResultType.RESULT:
-            res = [f"-- result: length {len(self.sorted_res)}"]
+            res = [f"-- result: length {self.row_cnt}"]
+            if not self.has_rows():
+                res.append(f"-- digest: {self.digest:032x}")
             for s in self.sorted_res:
                 res.append("-- " + s)
             return res
@@ -82,30 +349,37 @@ class Result:
     def print_log(self, level: str):
         if level == "info":
             if self.type == self.__ResultType.RESULT:
-                logger.info(f"result: length {len(self.sorted_res)}")
+                logger.info(f"result: length {self.row_cnt}")
                 for s in self.sorted_res:
                     logger.info(s)
             elif self.type == self.__ResultType.UPDATE:
                 logger.info("update: {}", self.update_num)
             elif self.type == self.__ResultType.ERROR:
                 logger.info("error: {}, message: {}", self.error, self.error_msg)
+            elif self.type == self.__ResultType.TIMEOUT:
+                logger.info("timeout: {}", self.error_msg)
         if level == "error":
             if self.type == self.__ResultType.RESULT:
-                logger.error(f"result: length {len(self.sorted_res)}")
+                logger.error(f"result: length {self.row_cnt}")
                 for s in self.sorted_res:
                     logger.error(s)
             elif self.type == self.__ResultType.UPDATE:
                 logger.error("update: {}", self.update_num)
             elif self.type == self.__ResultType.ERROR:
                 logger.error("error: {}, message: {}", self.error, self.error_msg)
+            elif self.type == self.__ResultType.TIMEOUT:
+                logger.error("timeout: {}", self.error_msg)
 
     def __eq__(self, other):
         if isinstance(other, Result):
+            # a statement that ran out of time has no result to compare, so it matches anything
+            if self.type == self.__ResultType.TIMEOUT or other.type == self.__ResultType.TIMEOUT:
+                return True
             # if both are error, we consider them are equal
             if self.type == self.__ResultType.ERROR and other.type == self.__ResultType.ERROR:
                 return True
             else:
                 return self.type == other.type and self.update_num == other.update_num and \
-                    len(self.sorted_res) == len(other.sorted_res) and self.sorted_res == other.sorted_res
+                    self.row_cnt == other.row_cnt and self.digest == other.digest
         return False
 
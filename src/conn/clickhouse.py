@@ -1,79 +1,62 @@
-import decimal
-import json
+import re
 from clickhouse_connect import get_client
-from loguru import logger
-from conn.base import Connection, Result
+from conn.base import Connection, Result, RowConverter
 
 
-class ClickHouseConnection(Connection):
-    def __init__(self, user: str, password: str, host: str, port: int, database: str, res_blacklist: list):
-        def clean_database(conn, database: str):
-            try:
-                conn.query('DROP DATABASE IF EXISTS ' + database)
-                conn.query('CREATE DATABASE ' + database)
-            except Exception as e:
-                logger.error('Create database {} failed, reason: {}', database, e)
-            finally:
-                conn.close()
+# TIMEOUT_EXCEEDED, raised by the max_execution_time setting, and QUERY_WAS_CANCELLED
+TIMEOUT_CODES = {'159', '394'}
+
 
-        tmp_config = {
-            'user': user,
-            'password': password,
-            'host': host,
-            'database': 'test',
-            'port': port,
-        }
-        tmp_conn = self.create_conn(tmp_config)
-        clean_database(tmp_conn, database)
+def get_column_kind(type_name: str):
+    for wrapper in ['Nullable(', 'LowCardinality(']:
+        if type_name.startswith(wrapper):
+            type_name = type_name[len(wrapper):-1]
+    if type_name.startswith(('Int', 'UInt')):
+        return 'int'
+    elif type_name.startswith('Float'):
+        return 'float'
+    elif type_name.startswith('Decimal'):
+        return 'decimal'
+    elif type_name.startswith(('String', 'FixedString')):
+        return 'str'
+    elif type_name.startswith('Date'):
+        return 'temporal'
+    elif type_name.startswith('Array'):
+        return 'list'
+    elif type_name.startswith('Map'):
+        return 'json'
+    return None
 
-        super().__init__(user, password, host, port, database, res_blacklist)
+
+class ClickHouseConnection(Connection):
+    version_sql = 'SELECT version()'
 
     def create_conn(self, config: dict):
         return get_client(username=config['user'], password=config['password'], host=config['host'],
                           port=config['port'], database=config['database'])
 
-    def execute(self, sql: str):
-        try:
-            res = []
-            rows = self.conn.query(sql).result_rows
-            for row in rows:
-                tmp_row = []
-                for col in row:
-                    if isinstance(col, (bytes, bytearray)):
-                        r = col.hex()
-                    elif isinstance(col, float) and col.is_integer():
-                        r = str(col) if 'e' in str(col) or 'E' in str(col) else int(col)
-                    elif isinstance(col, decimal.Decimal) and (float(col)).is_integer():
-                        r = str(col) if 'e' in str(col) or 'E' in str(col) else int(col)
-                    elif isinstance(col, dict):
-                        r = json.dumps(col)
-                    elif isinstance(col, list):
-                        r = sorted(col)
-                    else:
-                        r = str(col)
-                    tmp_row.append(r)
-                res.append(' * '.join(map(str, tmp_row)))
-            return Result(sql=sql, res=res)
-        except Exception as e:
-            if any(blacklisted in repr(e).upper() for blacklisted in self.res_blacklist):
-                return Result(sql=sql, error_msg=repr(e), blacklisted=True)
-            else:
-                return Result(sql=sql, error_msg=repr(e))
+    def limit_statement_time(self):
+        # sent with every query of the client, so the server stops the statement itself
+        self.conn.set_client_setting('max_execution_time', self.statement_timeout)
+        return True
+
+    def is_timeout(self, e: Exception):
+        return self.error_code(e) in TIMEOUT_CODES
 
-    def clean(self):
-        database = self.config['database']
-        tmp_config = {
-            'user': self.config['user'],
-            'password': self.config['password'],
-            'host': self.config['host'],
-            'port': self.config['port'],
-            'database': 'test',
-        }
-        tmp_conn = self.create_conn(tmp_config)
-        
+    def execute(self, sql: str, keep_rows: bool = True):
         try:
-            tmp_conn.query('DROP DATABASE IF EXISTS ' + database)
+            with self.watch():
+                query_res = self.conn.query(sql)
+            column_types = [col_type.name for col_type in query_res.column_types]
+            converter = RowConverter([get_column_kind(column_type) for column_type in column_types])
+            return Result(sql=sql, res=converter.convert(query_res.result_rows), column_types=column_types,
+                          keep_rows=keep_rows)
         except Exception as e:
-            logger.error('Clean database {} failed, reason: {}', database, e)
-        finally:
-            tmp_conn.close()
\ No newline at end of file
+            return self.error_result(sql, e)
+
+    def error_code(self, e: Exception):
+        error_code = re.search(r'Code: (\d+)', str(e))
+        return error_code.group(1) if error_code else None
+
+    def commit(self):
+        pass
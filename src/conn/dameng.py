@@ -1,33 +1,49 @@
-import decimal
-import json
+import re
 import dmPython
 from loguru import logger
-from conn.base import Connection, Result
+from conn.base import Connection, Result, RowConverter
 
 
-class DamengConnection(Connection):
-    def __init__(self, user: str, password: str, host: str, port: int, database: str, res_blacklist: list):
-        def clean_database(conn, database: str):
-            cursor = conn.cursor()
-            try:
-                cursor.execute(f'DROP SCHEMA IF EXISTS {database}' + ' CASCADE')
-                cursor.execute(f'CREATE SCHEMA {database}')
-            except Exception as e:
-                logger.error('Create database {} failed, reason: {}', database, e)
-            finally:
-                cursor.close()
-                conn.close()
+# dmPython type object name -> SYS.SYSCOLUMNS.TYPE$, integer types share dmPython.NUMBER and are left to the catalog
+DM_TYPES = {
+    'BIGINT': 'BIGINT',
+    'DECIMAL': 'DEC',
+    'REAL': 'REAL',
+    'DOUBLE': 'DOUBLE',
+    'STRING': 'VARCHAR',
+    'FIXED_STRING': 'CHAR',
+    'BINARY': 'VARBINARY',
+    'FIXED_BINARY': 'BINARY',
+    'BLOB': 'BLOB',
+    'CLOB': 'CLOB',
+    'DATE': 'DATE',
+    'TIME': 'TIME',
+    'TIMESTAMP': 'TIMESTAMP',
+}
+DM_TYPE_OBJECTS = {getattr(dmPython, name): type_name for name, type_name in DM_TYPES.items() if hasattr(dmPython, name)}
+DM_KINDS = {
+    'NUMBER': 'int',
+    'BIGINT': 'int',
+    'DECIMAL': 'decimal',
+    'REAL': 'float',
+    'DOUBLE': 'float',
+    'STRING': 'str',
+    'FIXED_STRING': 'str',
+    'CLOB': 'str',
+    'BINARY': 'bytes',
+    'FIXED_BINARY': 'bytes',
+    'BLOB': 'bytes',
+    'DATE': 'temporal',
+    'TIME': 'temporal',
+    'TIMESTAMP': 'temporal',
+}
+DM_KIND_OBJECTS = {getattr(dmPython, name): kind for name, kind in DM_KINDS.items() if hasattr(dmPython, name)}
+
 
-        tmp_config = {
-            'user': user,
-            'password': password,
-            'host': host,
-            'port': port,
-            'database': 'test',
-        }
-        tmp_conn = self.create_conn(tmp_config)
-        clean_database(tmp_conn, database)
-        super().__init__(user, password, host, port, database, res_blacklist)
+class DamengConnection(Connection):
+    create_database_sql = 'CREATE SCHEMA {}'
+    drop_database_sql = 'DROP SCHEMA IF EXISTS {} CASCADE'
+    version_sql = 'SELECT SVR_VERSION FROM V$INSTANCE'
 
     def create_conn(self, config: dict):
         try:
@@ -42,56 +58,25 @@ class DamengConnection(Connection):
             logger.error("Failed to connect to Dameng database, reason: {}", e)
             raise e
 
-    def execute(self, sql: str):
+    def execute(self, sql: str, keep_rows: bool = True):
         cursor = self.conn.cursor()
         try:
             cursor.execute(sql)
             if cursor.description is None:
                 return Result(sql=sql, update_num=cursor.rowcount)
             else:
-                res = []
-                for row in cursor.fetchall():
-                    tmp_row = []
-                    for col in row:
-                        if isinstance(col, (bytes, bytearray)):
-                            r = col.hex()
-                        elif isinstance(col, float) and col.is_integer():
-                            r = str(col) if 'e' in str(col) or 'E' in str(col) else int(col)
-                        elif isinstance(col, decimal.Decimal) and (float(col)).is_integer():
-                            r = str(col) if 'e' in str(col) or 'E' in str(col) else int(col)
-                        elif isinstance(col, dict):
-                            r = json.dumps(col)
-                        elif isinstance(col, list):
-                            r = sorted(col)
-                        else:
-                            r = str(col)
-                        tmp_row.append(r)
-                    res.append(' * '.join(map(str, tmp_row)))
-                return Result(sql=sql, res=res)
-        except Exception as e:
-            if any(blacklisted in str(e.args[0]).upper() for blacklisted in self.res_blacklist):
-                return Result(sql=sql, error_msg=str(e.args[0]), blacklisted=True)
-            else:
-                return Result(sql=sql, error_msg=str(e.args[0]))
-        finally:
-            cursor.close()
-    
-    def clean(self):
-        database = self.config['database']
-        tmp_config = {
-            'user': self.config['user'],
-            'password': self.config['password'],
-            'host': self.config['host'],
-            'port': self.config['port'],
-            'database': 'test',
-        }
-        tmp_conn = self.create_conn(tmp_config)
-        cursor = tmp_conn.cursor()
-        
-        try:
-            cursor.execute(f'DROP SCHEMA {database}' + ' CASCADE')
+                converter = RowConverter([DM_KIND_OBJECTS.get(description[1]) for description in cursor.description])
+                column_types = [DM_TYPE_OBJECTS.get(description[1]) for description in cursor.description]
+                return Result(sql=sql, res=converter.convert(iter(cursor.fetchone, None)), column_types=column_types,
+                              keep_rows=keep_rows)
         except Exception as e:
-            logger.error('Clean database {} failed, reason: {}', database, e)
+            return self.error_result(sql, e)
         finally:
             cursor.close()
-            tmp_conn.close()
+
+    def error_message(self, e: Exception):
+        return str(e.args[0])
+
+    def error_code(self, e: Exception):
+        error_code = re.search(r'CODE:(-?\d+)', str(e.args[0]))
+        return error_code.group(1) if error_code else None
@@ -0,0 +1,96 @@
+import threading
+import duckdb
+from conn.base import Connection, Result, RowConverter
+
+
+# column types that fetchnumpy returns without loss, so a value reads the same as through fetchall
+NUMPY_EXACT_TYPES = {'BOOLEAN', 'TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'UTINYINT', 'USMALLINT', 'UINTEGER',
+                     'UBIGINT', 'FLOAT', 'DOUBLE', 'VARCHAR'}
+# statements that return a result set, any other statement returns its affected row count
+QUERY_PREFIXES = ('SELECT', 'WITH', 'VALUES', 'FROM', 'TABLE', 'SHOW', 'DESCRIBE', 'SUMMARIZE', 'PRAGMA', 'EXPLAIN', '(')
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(path: str):
+    """Opens the database file (in memory if empty) once per process, every session is a cursor on it."""
+    path = path or ':memory:'
+    with _databases_lock:
+        if path not in _databases:
+            _databases[path] = duckdb.connect(path)
+        return _databases[path]
+
+
+def get_column_kind(type_name: str):
+    if type_name.endswith(']'):
+        return 'list'
+    elif type_name in ['TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT', 'UTINYINT', 'USMALLINT', 'UINTEGER',
+                       'UBIGINT', 'UHUGEINT']:
+        return 'int'
+    elif type_name in ['FLOAT', 'DOUBLE']:
+        return 'float'
+    elif type_name.startswith('DECIMAL'):
+        return 'decimal'
+    elif type_name == 'VARCHAR':
+        return 'str'
+    elif type_name in ['BLOB', 'BIT']:
+        return 'bytes'
+    elif type_name.startswith(('DATE', 'TIME', 'INTERVAL')):
+        return 'temporal'
+    elif type_name.startswith(('MAP', 'STRUCT')):
+        return 'json'
+    return None
+
+
+class DuckDBConnection(Connection):
+    """
+    In-process DuckDB session. The host setting is the database file (in memory if empty) and every test
+    database is a schema in it, so no statement leaves the process.
+    """
+    create_database_sql = 'CREATE SCHEMA {}'
+    drop_database_sql = 'DROP SCHEMA IF EXISTS {} CASCADE'
+    admin_database = 'main'
+    version_sql = 'SELECT version()'
+    # DuckDB has no statement time limit, the watchdog interrupts the statement
+    cancellable = True
+
+    def create_conn(self, config: dict):
+        conn = get_database(config['host']).cursor()
+        conn.execute(f"SET schema = '{config['database']}'")
+        return conn
+
+    def execute(self, sql: str, keep_rows: bool = True):
+        try:
+            with self.watch():
+                self.conn.execute(sql)
+                if not sql.lstrip().upper().startswith(QUERY_PREFIXES):
+                    rows = self.conn.fetchall()
+                    return Result(sql=sql, update_num=rows[0][0] if rows and rows[0] else 0)
+                column_types = [str(description[1]) for description in self.conn.description]
+                converter = RowConverter([get_column_kind(column_type) for column_type in column_types])
+                return Result(sql=sql, res=converter.convert(self.fetch_rows(column_types)), column_types=column_types,
+                              keep_rows=keep_rows)
+        except Exception as e:
+            return self.error_result(sql, e)
+
+    def fetch_rows(self, column_types: list):
+        """Fetches the result column by column when numpy holds every column exactly, row by row otherwise."""
+        if not all(column_type in NUMPY_EXACT_TYPES for column_type in column_types):
+            return self.conn.fetchall()
+        # masked (NULL) values become None
+        columns = [column.tolist() for column in self.conn.fetchnumpy().values()]
+        return zip(*columns)
+
+    def cancel(self):
+        self.conn.interrupt()
+
+    def is_timeout(self, e: Exception):
+        return isinstance(e, duckdb.InterruptException)
+
+    def error_code(self, e: Exception):
+        # DuckDB has no error numbers, the exception class names the kind of error, e.g. ConversionException
+        return type(e).__name__
+
+    def commit(self):
+        pass
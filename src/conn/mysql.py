@@ -1,33 +1,122 @@
-import decimal
-import json
+import time
 import mysql.connector
 from loguru import logger
-from conn.base import Connection, Result
+from mysql.connector.constants import FieldFlag, FieldType
+from conn.base import Connection, Result, RowConverter
+
+
+# result metadata type -> INFORMATION_SCHEMA.COLUMNS.DATA_TYPE
+MYSQL_TYPES = {
+    'DECIMAL': 'decimal',
+    'NEWDECIMAL': 'decimal',
+    'TINY': 'tinyint',
+    'SHORT': 'smallint',
+    'INT24': 'mediumint',
+    'LONG': 'int',
+    'LONGLONG': 'bigint',
+    'FLOAT': 'float',
+    'DOUBLE': 'double',
+    'BIT': 'bit',
+    'DATE': 'date',
+    'NEWDATE': 'date',
+    'TIME': 'time',
+    'DATETIME': 'datetime',
+    'TIMESTAMP': 'timestamp',
+    'YEAR': 'year',
+    'JSON': 'json',
+    'GEOMETRY': 'geometry',
+}
+MYSQL_STRING_TYPES = {
+    # type: (text type, binary type)
+    'VARCHAR': ('varchar', 'varbinary'),
+    'VAR_STRING': ('varchar', 'varbinary'),
+    'STRING': ('char', 'binary'),
+    'BLOB': ('text', 'blob'),
+    'TINY_BLOB': ('tinytext', 'tinyblob'),
+    'MEDIUM_BLOB': ('mediumtext', 'mediumblob'),
+    'LONG_BLOB': ('longtext', 'longblob'),
+}
+
+
+MYSQL_KINDS = {
+    'TINY': 'int',
+    'SHORT': 'int',
+    'INT24': 'int',
+    'LONG': 'int',
+    'LONGLONG': 'int',
+    'YEAR': 'int',
+    'BIT': 'int',
+    'FLOAT': 'float',
+    'DOUBLE': 'float',
+    'DECIMAL': 'decimal',
+    'NEWDECIMAL': 'decimal',
+    'DATE': 'temporal',
+    'NEWDATE': 'temporal',
+    'TIME': 'temporal',
+    'DATETIME': 'temporal',
+    'TIMESTAMP': 'temporal',
+    'JSON': 'str',
+}
+
+
+# statement stopped by max_execution_time (MySQL, Percona, TiDB), by KILL QUERY, by max_statement_time (MariaDB)
+# and by ob_query_timeout (OceanBase)
+TIMEOUT_ERRNOS = {3024, 1317, 1969, 4012}
+
+
+# character set number of the binary character set: only its strings are binary, the BINARY flag is also set
+# for the text columns of a _bin collation, such as utf8mb4_bin, the default collation of TiDB
+BINARY_CHARSET = 63
+
+
+def is_binary(description):
+    """Whether a string column holds binary strings, None if the connector does not report its character set."""
+    if len(description) <= 8 or description[8] is None:
+        return None
+    return description[8] == BINARY_CHARSET
+
+
+def get_column_kind(description):
+    type_name = FieldType.get_info(description[1])
+    if type_name in MYSQL_STRING_TYPES:
+        binary = is_binary(description)
+        return None if binary is None else 'bytes' if binary else 'str'
+    return MYSQL_KINDS.get(type_name)
+
+
+def get_column_type(description):
+    type_name = FieldType.get_info(description[1])
+    flags = description[7] if len(description) > 7 else 0
+    if type_name in MYSQL_STRING_TYPES:
+        binary = is_binary(description)
+        # left to the catalog query
+        if flags & (FieldFlag.ENUM | FieldFlag.SET) or binary is None:
+            return None
+        return MYSQL_STRING_TYPES[type_name][1 if binary else 0]
+    return MYSQL_TYPES.get(type_name)
+
+
+def multi_results(cursor, sql: str):
+    """Executes a multi-statement request, yielding the cursor once it holds the result of each statement."""
+    if mysql.connector.__version_info__ >= (9, 2):
+        # Connector/Python 9.2 replaced execute(multi=True) by mapped result sets
+        cursor.execute(sql, map_results=True)
+        yield cursor
+        while cursor.nextset():
+            yield cursor
+    else:
+        yield from cursor.execute(sql, multi=True)
 
 
 class MySQLConnection(Connection):
-    def __init__(self, user: str, password: str, host: str, port: int, database: str, res_blacklist: list):
-        def clean_database(conn, database: str):
-            cursor = conn.cursor()
-            try:
-                cursor.execute('DROP DATABASE IF EXISTS ' + database)
-                cursor.execute('CREATE DATABASE ' + database)
-            except Exception as e:
-                logger.error('Create database {} failed, reason: {}', database, e)
-            finally:
-                cursor.close()
-                conn.close()
-
-        tmp_config = {
-            'user': user,
-            'password': password,
-            'host': host,
-            'database': 'test',
-            'port': port, 
-        }
-        tmp_conn = self.create_conn(tmp_config)
-        clean_database(tmp_conn, database)
-        super().__init__(user, password, host, port, database, res_blacklist)
+    """Session of MySQL and of the servers speaking its protocol: MariaDB, TiDB, OceanBase and Percona."""
+    cancellable = True
+
+    def __init__(self, *args, **kwargs):
+        # side session issuing KILL QUERY for the watchdog, opened when first needed
+        self.killer = None
+        self.limit_sql = None
+        super().__init__(*args, **kwargs)
 
     def create_conn(self, config: dict):
         return mysql.connector.connect(
@@ -36,58 +125,86 @@ class MySQLConnection(Connection):
             connection_timeout=10,
         )
 
-    def execute(self, sql: str):
+    def limit_statement_time(self):
+        """Sets the time limit variable of the server, max_execution_time only limits SELECT statements."""
+        if self.limit_sql is None:
+            version = self.server_version()
+            if 'MariaDB' in version:
+                self.limit_sql = f'SET SESSION max_statement_time = {self.statement_timeout}'
+            elif 'OceanBase' in version:
+                self.limit_sql = f'SET SESSION ob_query_timeout = {int(self.statement_timeout * 1000000)}'
+            else:
+                self.limit_sql = f'SET SESSION max_execution_time = {int(self.statement_timeout * 1000)}'
+        res = self.execute(self.limit_sql)
+        if res.is_error():
+            logger.info('Failed to set the statement time limit, reason: {}', res.error_msg)
+        return not res.is_error()
+
+    def cancel(self):
+        if self.killer is None:
+            self.killer = self.open_admin(self.config['user'], self.config['password'], self.config['host'],
+                                          self.config['port'], self.res_blacklist)
+        self.killer.execute(f'KILL QUERY {self.conn.connection_id}')
+
+    def is_timeout(self, e: Exception):
+        return getattr(e, 'errno', None) in TIMEOUT_ERRNOS
+
+    def execute(self, sql: str, keep_rows: bool = True):
         cursor = self.conn.cursor()
         try:
-            cursor.execute(sql)
-            if cursor.description is None:
-                return Result(sql=sql, update_num=cursor.rowcount)
-            else:
-                res = []
-                for row in cursor:
-                    tmp_row = []
-                    for col in row:
-                        if isinstance(col, (bytes, bytearray)):
-                            r = col.hex()
-                        elif isinstance(col, float) and col.is_integer():
-                            r = str(col) if 'e' in str(col) or 'E' in str(col) else int(col)
-                        elif isinstance(col, decimal.Decimal) and (float(col)).is_integer():
-                            r = str(col) if 'e' in str(col) or 'E' in str(col) else int(col)
-                        elif isinstance(col, dict):
-                            r = json.dumps(col)
-                        elif isinstance(col, list):
-                            r = sorted(col)
-                        else:
-                            r = str(col)
-                        tmp_row.append(r)
-                    res.append(' * '.join(map(str, tmp_row)))
-                return Result(sql=sql, res=res)
+            with self.watch():
+                cursor.execute(sql)
+                return self.cursor_result(cursor, sql, keep_rows)
         except Exception as e:
-            
             # self.conn.rollback()
-            if any(blacklisted in repr(e).upper() for blacklisted in self.res_blacklist):
-                return Result(sql=sql, error_msg=repr(e), blacklisted=True)
-            else:
-                return Result(sql=sql, error_msg=repr(e))
+            return self.error_result(sql, e)
         finally:
             cursor.close()
-    
-    def clean(self):
-        database = self.config['database']
-        tmp_config = {
-            'user': self.config['user'],
-            'password': self.config['password'],
-            'host': self.config['host'],
-            'port': self.config['port'],
-            'database': 'test',
-        }
-        tmp_conn = self.create_conn(tmp_config)
-        cursor = tmp_conn.cursor()
-        
+
+    def cursor_result(self, cursor, sql: str, keep_rows: bool):
+        if cursor.description is None:
+            return Result(sql=sql, update_num=cursor.rowcount)
+        converter = RowConverter([get_column_kind(description) for description in cursor.description])
+        column_types = [get_column_type(description) for description in cursor.description]
+        return Result(sql=sql, res=converter.convert(cursor), column_types=column_types, keep_rows=keep_rows)
+
+    def execute_batch(self, sqls: list, keep_rows: bool = True):
+        """
+        Sends the statements as one multi-statement request and splits the result sets back per statement.
+        The server stops at the first failing statement, the statements after it are sent again in a new request.
+        """
+        if not sqls:
+            return []
+        results = []
+        cursor = self.conn.cursor()
         try:
-            cursor.execute('DROP DATABASE IF EXISTS ' + database)
+            with self.watch():
+                # the server runs the statements one after the other, so each one took the time until its result was read
+                start = time.perf_counter()
+                for _ in multi_results(cursor, ';\n'.join(sql.rstrip().rstrip(';') for sql in sqls)):
+                    results.append(self.cursor_result(cursor, sqls[len(results)], keep_rows))
+                    end = time.perf_counter()
+                    results[-1].elapsed, start = end - start, end
+                    # every statement of the batch has its own time budget
+                    if self.watchdog is not None:
+                        self.watchdog.start()
         except Exception as e:
-            logger.error('Clean database {} failed, reason: {}', database, e)
+            if len(results) == len(sqls):
+                raise
+            results.append(self.error_result(sqls[len(results)], e))
         finally:
             cursor.close()
-            tmp_conn.close()
\ No newline at end of file
+        return results + self.execute_batch(sqls[len(results):], keep_rows)
+
+    def error_code(self, e: Exception):
+        return getattr(e, 'errno', None)
+
+    def reset_session(self):
+        self.conn.reset_session()
+        if self.statement_timeout > 0:
+            self.limit_statement_time()
+
+    def close(self):
+        super().close()
+        if self.killer is not None:
+            self.killer.close()
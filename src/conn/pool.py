@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+from loguru import logger
+
+
+class SchemaPool:
+    """
+    A long-lived admin session plus a set of pre-created databases that are recycled between iterations.
+
+    Released connections are reset by dropping only the test tables, so an iteration neither reconnects
+    nor creates or drops a database.
+    """
+
+    def __init__(self, conn_class, db_config: dict, prefix: str, size: int):
+        self.conn_class = conn_class
+        self.db_config = db_config
+        self.prefix = prefix
+        self.size = size
+        self.created = 0
+        self.lock = threading.Lock()
+        self.admin = conn_class.open_admin(**db_config)
+        self.idle = [self._create() for _ in range(size)]
+
+    def _create(self):
+        with self.lock:
+            database = f'{self.prefix}_{self.created}'
+            self.created += 1
+        return self.conn_class(**self.db_config, database=database, admin=self.admin)
+
+    def acquire(self):
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+        return conn if conn is not None else self._create()
+
+    def release(self, conn):
+        try:
+            recycled = conn.reset()
+        except Exception as e:
+            logger.error('Reset database {} failed, reason: {}', conn.config['database'], e)
+            recycled = False
+        with self.lock:
+            if recycled and len(self.idle) < self.size:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+        self.admin.close()
+
+
+class Fixture:
+    """A database whose original table is populated, with the results of the statements that populated it."""
+
+    def __init__(self, conn, column_types: list, create_res, insert_res: list, loop: int):
+        self.conn = conn
+        self.column_types = column_types
+        self.create_res = create_res
+        self.insert_res = insert_res
+        # the iteration whose rows populated the table
+        self.loop = loop
+
+
+class FixtureCache:
+    """
+    Populated original tables kept for reuse by later iterations, keyed by their normalized column types.
+
+    Every fixture holds a database checked out of the pool, so capacity caps the number of live databases;
+    the least recently used fixture goes back to the pool when a new one does not fit.
+    """
+
+    def __init__(self, pool: SchemaPool, capacity: int):
+        self.pool = pool
+        self.capacity = capacity
+        self.fixtures = OrderedDict()
+
+    def get(self, key):
+        fixture = self.fixtures.get(key)
+        if fixture is not None:
+            self.fixtures.move_to_end(key)
+        return fixture
+
+    def put(self, key, conn, column_types: list, create_res, insert_res: list, loop: int):
+        """Caches the populated database of conn, returns False if the cache is disabled."""
+        if self.capacity <= 0:
+            return False
+        self.evict(key)
+        while len(self.fixtures) >= self.capacity:
+            self.evict(next(iter(self.fixtures)))
+        self.fixtures[key] = Fixture(conn, list(column_types), create_res, list(insert_res), loop)
+        return True
+
+    def pop(self, key):
+        """Forgets a fixture without releasing its database, which the caller now owns."""
+        return self.fixtures.pop(key, None)
+
+    def evict(self, key):
+        fixture = self.fixtures.pop(key, None)
+        if fixture is not None:
+            self.pool.release(fixture.conn)
+
+    def close(self):
+        while self.fixtures:
+            self.evict(next(iter(self.fixtures)))
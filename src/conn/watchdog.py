@@ -0,0 +1,69 @@
+import time
+import threading
+from loguru import logger
+
+
+class Watchdog:
+    """
+    Cancels the statement of a session once it runs past the time budget. One timer thread, started with the
+    first statement, serves all the statements of the session, so arming it costs no thread per statement.
+    """
+
+    def __init__(self, budget: float, cancel):
+        self.budget = budget
+        self.cancel = cancel
+        self.deadline = None
+        # whether the watchdog cancelled the last statement
+        self.fired = False
+        self.cond = threading.Condition()
+        self.thread = None
+        # whether the timer thread waits without a deadline, it is only woken up then
+        self.idle = False
+        self.closed = False
+
+    def start(self):
+        """Arms the watchdog for the statement about to run, or for the next statement of a running batch."""
+        with self.cond:
+            if self.thread is None and not self.closed:
+                self.thread = threading.Thread(target=self._run, name='watchdog', daemon=True)
+                self.thread.start()
+            self.deadline = time.monotonic() + self.budget
+            self.fired = False
+            # a thread waiting for an earlier deadline wakes up by itself and waits again for the remaining time
+            if self.idle:
+                self.cond.notify()
+
+    def stop(self):
+        # waits for a cancel in progress, so it never reaches the next statement
+        with self.cond:
+            self.deadline = None
+
+    def close(self):
+        """Ends the timer thread and drops the session it cancels statements of."""
+        with self.cond:
+            self.closed = True
+            self.deadline = None
+            self.cancel = None
+            self.cond.notify()
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        with self.cond:
+            while not self.closed:
+                if self.deadline is None:
+                    self.idle = True
+                    self.cond.wait()
+                    self.idle = False
+                    continue
+                remaining = self.deadline - time.monotonic()
+                if remaining > 0:
+                    self.cond.wait(remaining)
+                    continue
+                self.deadline = None
+                self.fired = True
+                try:
+                    self.cancel()
+                except Exception as e:
+                    logger.error('Failed to cancel a statement past {}s, reason: {}', self.budget, e)
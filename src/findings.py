@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import zlib
+import queue
+import sqlite3
+import hashlib
+import argparse
+import threading
+from loguru import logger
+from config import config
+from util import finding_path, finding_signature, finding_to_sql, sql_to_file
+
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS script (
+           hash TEXT PRIMARY KEY,
+           content BLOB NOT NULL)''',
+    '''CREATE TABLE IF NOT EXISTS finding (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           created REAL NOT NULL,
+           target TEXT NOT NULL,
+           worker INTEGER,
+           loop INTEGER,
+           name TEXT NOT NULL,
+           op TEXT NOT NULL,
+           sz INTEGER,
+           column_types TEXT,
+           error_codes TEXT,
+           errors BLOB,
+           create_sql TEXT,
+           insert_hash TEXT REFERENCES script (hash),
+           derived_sql TEXT,
+           pairs BLOB,
+           signature TEXT,
+           plan TEXT,
+           latency TEXT)''',
+    'CREATE INDEX IF NOT EXISTS finding_op ON finding (target, op)',
+    'CREATE INDEX IF NOT EXISTS finding_created ON finding (created)',
+    'CREATE INDEX IF NOT EXISTS finding_insert ON finding (insert_hash)',
+    'CREATE INDEX IF NOT EXISTS finding_signature ON finding (signature)',
+]
+
+# the signature index outlives the rotated stores, so a bug already reported by an earlier run is not written again
+SIGNATURE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS signature (
+           target TEXT NOT NULL,
+           hash TEXT NOT NULL,
+           op TEXT NOT NULL,
+           description TEXT,
+           first_name TEXT,
+           first_seen REAL,
+           last_seen REAL,
+           hits INTEGER NOT NULL DEFAULT 0,
+           PRIMARY KEY (target, hash))''',
+    'CREATE INDEX IF NOT EXISTS signature_hits ON signature (target, hits)',
+]
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value).encode('utf-8'))
+
+
+def _unpack(value):
+    return json.loads(zlib.decompress(value).decode('utf-8'))
+
+
+def open_store(path: str, schema: list = SCHEMA):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    db = sqlite3.connect(path, timeout=60)
+    db.execute('PRAGMA journal_mode=WAL')
+    for sql in schema:
+        db.execute(sql)
+    db.commit()
+    return db
+
+
+def rotate_store(path: str):
+    """
+    Moves the store of the previous run aside (path-{timestamp}.db, path-{timestamp}-{n}.db for stores rotated
+    within the same second) instead of deleting it. A rotated store is never overwritten.
+    """
+    if not os.path.exists(path):
+        return
+    stem, ext = os.path.splitext(path)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    n = 0
+    while True:
+        rotated = f'{stem}-{timestamp}{ext}' if n == 0 else f'{stem}-{timestamp}-{n}{ext}'
+        try:
+            # claim the name first, so a concurrent rotation cannot pick it as well
+            open(rotated, 'x').close()
+            break
+        except FileExistsError:
+            n += 1
+    # fold the write-ahead log back into the database file before moving it
+    db = sqlite3.connect(path)
+    db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    db.close()
+    os.replace(path, rotated)
+    for suffix in ['-wal', '-shm']:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    logger.info(f'Rotated findings store {path} to {rotated}')
+
+
+class FindingStore:
+    """
+    Append-only SQLite store of findings, written by a background thread so the fuzzing loop never waits on disk.
+
+    Insert scripts are content-addressed: identical scripts are stored once in the script table and
+    referenced by their hash. Each finding is fingerprinted (util.finding_signature) and only the first
+    finding of a signature is written in full; later ones only count a hit in the shared signature index.
+    """
+
+    def __init__(self, path: str, target: str, worker: int, signature_path: str = config.signature_index):
+        self.path = path
+        self.signature_path = signature_path
+        self.target = target
+        self.worker = worker
+        self.queue = queue.Queue()
+        self.written = 0
+        self.duplicates = 0
+        # open the stores here so schema errors surface in the caller
+        open_store(path).close()
+        open_store(signature_path, SIGNATURE_SCHEMA).close()
+        self.thread = threading.Thread(target=self._run, name='finding-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, finding: dict, loop: int, column_types: list, plan: dict = None):
+        self.queue.put(dict(finding, created=time.time(), loop=loop, column_types=column_types, plan=plan))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        db = open_store(self.path)
+        signature_db = open_store(self.signature_path, SIGNATURE_SCHEMA)
+        try:
+            while True:
+                finding = self.queue.get()
+                if finding is None:
+                    break
+                try:
+                    signature, description = finding_signature(finding, finding['column_types'])
+                    if self._hit(signature_db, signature, description, finding):
+                        self._write(db, finding, signature)
+                        self.written += 1
+                    else:
+                        self.duplicates += 1
+                except Exception as e:
+                    logger.error(f"Failed to store finding {finding['name']}: {e}")
+        finally:
+            db.close()
+            signature_db.close()
+            logger.info(f'Findings store: {self.written} findings written, {self.duplicates} duplicates counted')
+
+    def _hit(self, signature_db, signature: str, description: str, finding: dict):
+        """Counts a hit of the signature and returns whether it is the first one."""
+        with signature_db:
+            # the insert takes the write lock, so exactly one of the concurrent workers sees a new signature
+            new = signature_db.execute('INSERT OR IGNORE INTO signature (target, hash, op, description, first_name, '
+                                       'first_seen, last_seen, hits) VALUES (?, ?, ?, ?, ?, ?, ?, 1)',
+                                       (self.target, signature, finding['op'], description, finding['name'],
+                                        finding['created'], finding['created'])).rowcount == 1
+            if not new:
+                signature_db.execute('UPDATE signature SET hits = hits + 1, last_seen = ? WHERE target = ? AND hash = ?',
+                                     (finding['created'], self.target, signature))
+        return new
+
+    def _write(self, db, finding: dict, signature: str):
+        script = json.dumps(finding['insert_sqls']).encode('utf-8')
+        insert_hash = hashlib.sha256(script).hexdigest()
+        with db:
+            db.execute('INSERT OR IGNORE INTO script (hash, content) VALUES (?, ?)', (insert_hash, zlib.compress(script)))
+            db.execute('INSERT INTO finding (created, target, worker, loop, name, op, sz, column_types, error_codes, '
+                       'errors, create_sql, insert_hash, derived_sql, pairs, signature, plan, latency) '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                       (finding['created'], self.target, self.worker, finding['loop'], finding['name'], finding['op'],
+                        finding['sz'], json.dumps(finding['column_types']), json.dumps(finding['error_codes']),
+                        _pack(finding['errors']), finding['create_sql'], insert_hash, finding['derived_sql'],
+                        _pack(finding['pairs']), signature, json.dumps(finding['plan']),
+                        json.dumps(finding['latency']) if 'latency' in finding else None))
+
+
+def load_findings(db, ids: list = None):
+    """Reads findings back from a store, in the layout produced by util.collect_res."""
+    # stores written before plans and latencies were recorded lack their columns
+    columns = [row[1] for row in db.execute('PRAGMA table_info(finding)')]
+    optional = ', '.join(f'f.{column}' if column in columns else 'NULL' for column in ['plan', 'latency'])
+    sql = ('SELECT f.id, f.created, f.target, f.worker, f.loop, f.name, f.op, f.sz, f.column_types, f.error_codes, '
+           f'f.errors, f.create_sql, s.content, f.derived_sql, f.pairs, {optional} FROM finding f JOIN script s ON f.insert_hash = s.hash')
+    if ids:
+        sql += f' WHERE f.id IN ({", ".join("?" for _ in ids)})'
+    for row in db.execute(sql + ' ORDER BY f.id', ids or []):
+        yield {
+            'id': row[0],
+            'created': row[1],
+            'target': row[2],
+            'worker': row[3],
+            'loop': row[4],
+            'name': row[5],
+            'op': row[6],
+            'sz': row[7],
+            'column_types': json.loads(row[8]),
+            'error_codes': json.loads(row[9]),
+            'errors': _unpack(row[10]),
+            'create_sql': row[11],
+            'insert_sqls': _unpack(row[12]),
+            'derived_sql': row[13],
+            'pairs': _unpack(row[14]),
+            'plan': json.loads(row[15]) if row[15] else None,
+            'latency': json.loads(row[16]) if row[16] else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List findings in a findings store or export them as .sql files')
+    parser.add_argument('store', type=str, help='Path of the store, e.g. ../res/mysql/findings.db')
+    parser.add_argument('--id', type=int, nargs='*', help='Only these findings')
+    parser.add_argument('--export', type=str, help='Write the findings to {op}-{sz}/{name}.sql under this directory')
+    parser.add_argument('--plan', action='store_true', help='Also print the loop and the scheduler picks to replay each finding with')
+    parser.add_argument('--signatures', action='store_true',
+                        help=f'The path is a signature index (e.g. {config.signature_index}): list its signatures by hits')
+    args = parser.parse_args()
+
+    db = sqlite3.connect(args.store)
+    try:
+        if args.signatures:
+            for row in db.execute('SELECT hits, target, first_name, description FROM signature ORDER BY hits DESC'):
+                print('\t'.join(str(value) for value in row))
+            return
+        for finding in load_findings(db, args.id):
+            if args.export:
+                sql_to_file(finding_to_sql(finding), finding_path(args.export, finding))
+            else:
+                created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(finding['created']))
+                line = f"{finding['id']}\t{created}\t{finding['name']}\t{finding['op']}\t{finding['column_types']}\t{finding['error_codes']}"
+                if args.plan:
+                    line += f"\t{finding['loop']}\t{json.dumps(finding['plan'])}"
+                print(line)
+    except BrokenPipeError:
+        # the reader of the listing went away, e.g. head: stop quietly, and keep the interpreter from
+        # failing again when it flushes stdout on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
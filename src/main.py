@@ -1,13 +1,29 @@
+import os
 import sys
+import json
+import time
 import random
 import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
 from loguru import logger
 from config import config
-from util import clean_dir, get_conn, log_res, read_file
+from util import clean_dir, collect_latency, collect_res, derive_seed, finding_signature, get_pool, normalize_type, read_file
+from conn.pool import FixtureCache
+from conn.base import Result
 from sql.sql_generator import SQLGenerator
+from sql.query import DERIVED_TABLE, ORI_TABLE, derived_column_name
+from validity import DerivedTypeCache, ValidityCache
+from findings import FindingStore, rotate_store
+from metrics import Metrics, PhaseClock
+from scheduler import Scheduler
+from checkpoint import Progress, StateFile
 import traceback
 from enum import Enum
 
+
 class OpType(Enum):
     AGGREGATE = 1
     FUNCTION = 2
@@ -45,9 +61,10 @@ def get_derived_type(conn, target: str, derived_table: str, col: str):
                                     f"JOIN sys.tables t ON c.table_id = t.id "
                                     f"WHERE t.name = '{derived_table}' AND c.name = '{col}';")
     elif target == 'duckdb':
-        res = conn.execute(f"SELECT column_name, data_type "
+        res = conn.execute(f"SELECT data_type "
                                     f"FROM information_schema.columns "
-                                    f"WHERE table_name = '{derived_table}' AND column_name = '{col}';")
+                                    f"WHERE table_schema = '{conn.config['database']}' AND "
+                                    f"table_name = '{derived_table}' AND column_name = '{col}';")
     elif target == 'dameng':
         res = conn.execute(f"""SELECT C.TYPE$
                                     FROM SYS.SYSCOLUMNS C
@@ -68,8 +85,41 @@ def get_derived_type(conn, target: str, derived_table: str, col: str):
     return derived_type
 
 
+# memoized type of the derived column, keyed by (target, op, test column types)
+derived_type_cache = {}
+
+
+def lookup_derived_type(target: str, op: str, test_column_types: list, probe: Result = None):
+    """
+    Returns the type of the derived column without querying the catalog: the memoized type of the
+    (target, op, test column types) combination, or else the first column type in the result metadata of probe.
+    """
+    key = (target, op, tuple(test_column_types))
+    if key not in derived_type_cache and probe is not None and probe.column_types and probe.column_types[0]:
+        derived_type_cache[key] = probe.column_types[0]
+    return derived_type_cache.get(key)
+
+
+def resolve_derived_type(conn, target: str, op: str, test_column_types: list, probe: Result, derived_table: str, col: str):
+    """Like lookup_derived_type, but falls back to the catalog query of get_derived_type and memoizes its answer."""
+    derived_type = lookup_derived_type(target, op, test_column_types, probe)
+    if derived_type is None:
+        derived_type = get_derived_type(conn, target, derived_table, col)
+        derived_type_cache[(target, op, tuple(test_column_types))] = derived_type
+    return derived_type
+
+
+def latency_diverges(base_elapsed: float, equal_elapsed: float):
+    """Whether one select of a pair took config.latency_ratio times as long as the other, and config.latency_min_seconds at least."""
+    if not config.latency_ratio or base_elapsed is None or equal_elapsed is None:
+        return False
+    slow, fast = max(base_elapsed, equal_elapsed), min(base_elapsed, equal_elapsed)
+    return slow >= config.latency_min_seconds and slow >= config.latency_ratio * fast
+
+
 def construct_derived_table(conn, target: str, ori_table: str, derived_table: str, other_column_names: list, 
-                          other_column_types: list, test_expr: str, op_type: OpType, dest_res: list, insert_res: list):
+                          other_column_types: list, test_exprs: list, op_type: OpType, dest_res: list, insert_res: list,
+                          derived_types: list = None):
     """
     Constructs a derived table based on the target database system and operation type.
     
@@ -79,12 +129,14 @@ def construct_derived_table(conn, target: str, ori_table: str, derived_table: st
         derived_table: Name of the derived table to create
         other_column_names: List of column names besides the test expression
         other_column_types: List of column types for other columns
-        test_expr: The test expression to evaluate
+        test_exprs: The test expressions to evaluate, stored in the columns named by derived_column_name
         op_type: Type of operation (1 for aggregate, others for non-aggregate)
         ori_res: List to store original results
         insert_res: List to store insert results
+        derived_types: Known types of the test expressions, only used by TiDB (looked up through a view if None)
     """
     # Prepare column definitions
+    test_columns_with_alias = ", ".join([f"({expr}) AS {derived_column_name(k)}" for k, expr in enumerate(test_exprs)])
     other_columns_with_alias = ", ".join([f"{col} AS {col}" for col in other_column_names])
     if other_columns_with_alias:
         other_columns_with_alias = f', {other_columns_with_alias}'
@@ -96,245 +148,874 @@ def construct_derived_table(conn, target: str, ori_table: str, derived_table: st
 
     # Create table based on target database system
     if target == 'clickhouse':
-        res = _create_clickhouse_table(conn, ori_table, derived_table, test_expr, other_columns_with_alias, 
+        res = _create_clickhouse_table(conn, ori_table, derived_table, test_columns_with_alias, other_columns_with_alias, 
                                      group_by_clause)
     elif target == 'tidb':
         try:
-            res = _create_tidb_table(conn, ori_table, derived_table, test_expr, other_column_names, 
-                                    other_column_types, group_by_clause, insert_res)
+            res = _create_tidb_table(conn, ori_table, derived_table, test_exprs, other_column_names, 
+                                    other_column_types, group_by_clause, insert_res, derived_types)
         except ValueError as e:
             raise ValueError(f'Failed to create derived table {derived_table}: {e}')
     else:
-        res = _create_default_table(conn, ori_table, derived_table, test_expr, other_columns_with_alias, group_by_clause)
+        res = _create_default_table(conn, ori_table, derived_table, test_columns_with_alias, other_columns_with_alias, group_by_clause)
     dest_res.append(res)
     if res.is_error():
         raise ValueError(f'Failed to create derived table {derived_table}: {res.error_msg}, sql: {res.sql}')
 
-def _create_clickhouse_table(conn, ori_table, derived_table, test_expr, other_columns_with_alias, group_by_clause):
+def _create_clickhouse_table(conn, ori_table, derived_table, test_columns_with_alias, other_columns_with_alias, group_by_clause):
     """Helper function for Clickhouse table creation"""
-    base_sql = f'CREATE TABLE {derived_table} ORDER BY c0 AS (SELECT ({test_expr}) AS c0 {other_columns_with_alias} FROM {ori_table} {group_by_clause})'
+    base_sql = f'CREATE TABLE {derived_table} ORDER BY c0 AS (SELECT {test_columns_with_alias} {other_columns_with_alias} FROM {ori_table} {group_by_clause})'
     return conn.execute(base_sql)
 
-def _create_tidb_table(conn, ori_table, derived_table, test_expr, other_column_names, other_column_types, 
-                      group_by_clause, insert_res):
+def _create_tidb_table(conn, ori_table, derived_table, test_exprs, other_column_names, other_column_types, 
+                      group_by_clause, insert_res, derived_types=None):
     """Helper function for TiDB table creation"""
-    # Create temporary view to get derived type
-    view_sql = f'CREATE OR REPLACE VIEW {derived_table} AS (SELECT ({test_expr}) AS c0 FROM {ori_table} {group_by_clause})'
-    conn.execute(view_sql)
-    derived_type = get_derived_type(conn, 'tidb', derived_table, 'c0')
-    conn.execute(f'DROP VIEW {derived_table}')
+    derived_types = list(derived_types or [None] * len(test_exprs))
+    if None in derived_types:
+        # Create temporary view to get derived types
+        test_columns = ", ".join([f"({expr}) AS {derived_column_name(k)}" for k, expr in enumerate(test_exprs)])
+        view_sql = f'CREATE OR REPLACE VIEW {derived_table} AS (SELECT {test_columns} FROM {ori_table} {group_by_clause})'
+        conn.execute(view_sql)
+        for k, derived_type in enumerate(derived_types):
+            if derived_type is None:
+                derived_types[k] = get_derived_type(conn, 'tidb', derived_table, derived_column_name(k))
+        conn.execute(f'DROP VIEW {derived_table}')
     
     # Create table with proper column definitions
+    test_columns = ', '.join([f'{derived_column_name(k)} {derived_type}' for k, derived_type in enumerate(derived_types)])
     other_columns = ', '.join([f'{col_name} {col_type}' for col_name, col_type in zip(other_column_names, other_column_types)])
     other_columns = f', {other_columns}' if other_columns else ''
-    res = conn.execute(f'CREATE TABLE {derived_table} (c0 {derived_type} {other_columns})')
+    res = conn.execute(f'CREATE TABLE {derived_table} ({test_columns} {other_columns})')
     
     # Insert data
+    test_cols = ', '.join([f'({expr})' for expr in test_exprs])
     other_cols = f', {", ".join(other_column_names)}' if other_column_names else ''
-    base_sql = f'INSERT INTO {derived_table} SELECT ({test_expr}) {other_cols} FROM {ori_table} {group_by_clause}'
+    base_sql = f'INSERT INTO {derived_table} SELECT {test_cols} {other_cols} FROM {ori_table} {group_by_clause}'
     insert_res.append(conn.execute(base_sql))
     if insert_res[-1].is_error():
         raise ValueError(f'Failed to insert data into {derived_table}: {insert_res[-1].error_msg}, sql: {insert_res[-1].sql}')
     return res
 
-def _create_default_table(conn, ori_table, derived_table, test_expr, other_columns_with_alias, group_by_clause):
+def _create_default_table(conn, ori_table, derived_table, test_columns_with_alias, other_columns_with_alias, group_by_clause):
     """Helper function for default table creation"""
-    base_sql = f'CREATE TABLE {derived_table} AS (SELECT ({test_expr}) AS c0 {other_columns_with_alias} FROM {ori_table} {group_by_clause})'
+    base_sql = f'CREATE TABLE {derived_table} AS (SELECT {test_columns_with_alias} {other_columns_with_alias} FROM {ori_table} {group_by_clause})'
     return conn.execute(base_sql)
 
 
-def main():
-    conn = None
-    ori_res = []
-    dest_res = []
-    insert_res = []
-    
-    try:
-        parser = argparse.ArgumentParser()
-        parser.add_argument('target', type=str, help='The target database name, support mysql, mariadb, tidb, clickhouse')
-        parser.add_argument('--debug', action='store_true', help='Enable debug logging')
-        args = parser.parse_args()
-
-        target = args.target
-        type_path = f'./seed/{target}/type'
-        agg_path = f'./seed/{target}/agg'
-        func_path = f'./seed/{target}/func'
-        pred_path = f'./seed/{target}/pred'
-        db_config_path = f'./seed/{target}/config'
-        log_path = f'../log/{target}/'
-        out_path = f'../res/{target}/'
-
-        logger.remove()
-        logger.add(sys.stderr, level='ERROR')
-        if args.debug:
-            logger.add(log_path + 'error_{time}.log', 
-                        format='{time} {level} {message}', 
-                        level='ERROR', 
-                        rotation='10 MB', 
-                        compression='zip')
-            logger.add(log_path + 'info_{time}.log', 
-                        format='{time} {level} {message}', 
-                        level='INFO', 
-                        rotation='50 MB', 
-                        compression='zip') 
-        random.seed(config.seed)
-
-        clean_dir(out_path)
-        type_list = read_file(type_path)
-        agg_list = read_file(agg_path)
-        func_list = read_file(func_path)
-        pred_list = read_file(pred_path)
+def insert_rows(conn, sql_generator: SQLGenerator, table: str, column_names: list, rows: list, insert_res: list):
+    """
+    Inserts the generated rows using multi-row INSERTs of up to config.insert_batch_size rows.
+
+    Every logical row is still recorded in insert_res as its own single-row INSERT, so the logged
+    reproducers stay exact. A batch that fails is replayed row by row to record which rows fail.
+    """
+    batch_size = max(1, config.insert_batch_size)
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        res = conn.execute(sql_generator.generate_bulk_insert(table, column_names, batch))
+        if len(batch) == 1:
+            insert_res.append(res)
+        elif res.is_error():
+            for row in batch:
+                insert_res.append(conn.execute(sql_generator.generate_bulk_insert(table, column_names, [row])))
+        else:
+            for row in batch:
+                insert_res.append(Result(sql=sql_generator.generate_bulk_insert(table, column_names, [row]), update_num=1))
+
+
+def get_derived_combination(op_type: OpType, test_column_types: list, other_column_types: list):
+    """Column types the derived table depends on: the test columns, plus the GROUP BY columns of aggregates."""
+    if op_type == OpType.AGGREGATE:
+        return test_column_types + ['GROUP BY'] + other_column_types
+    return test_column_types
+
+
+class CaseGenerator:
+    """
+    Generates the test cases: the column types and rows of the original table, the test expressions and
+    their select pairs. Runs in the worker itself, or in the producer processes started with --producers.
+    """
+
+    def __init__(self, target: str, derived_types: DerivedTypeCache = None, seed: int = None):
+        self.target = target
+        self.derived_types = derived_types
+        self.seed = config.seed if seed is None else seed
+        self.sql_generator = SQLGenerator(target)
+
+        self.type_list = read_file(f'./seed/{target}/type')
+        self.agg_list = read_file(f'./seed/{target}/agg')
+        self.func_list = read_file(f'./seed/{target}/func')
+        self.pred_list = read_file(f'./seed/{target}/pred')
         if target == 'mysql':
-            db_config_list = read_file(db_config_path)
+            self.db_config_list = read_file(f'./seed/{target}/config')
         else:
-            db_config_list = []
-        loop = 0
-        while True:
-            loop += 1
-            test_column = random.randint(1, config.test_column_cnt)
-            other_column = random.randint(0, config.other_column_cnt)
-            column_types = []
-            column_names = []
-            op_type = random.choice(list(OpType))
-
-            # select target operation
-            if op_type == OpType.AGGREGATE:
-                op = random.choice(agg_list)
-                other_column = max(1, other_column)
-            elif op_type == OpType.FUNCTION:
-                op = random.choice(func_list)
-            elif op_type == OpType.PREDICATE:
-                op = random.choice(pred_list)
-                other_column = max(1, other_column)
-        
-            # generate column types and names in original table
-            for i in range(test_column + other_column):
-                column_type = random.choice(type_list)
-                if column_type.startswith('ENUM'):
-                    enum_size = random.randint(2, 5)
-                    enum_values = [f"'val{j}'" for j in range(enum_size)]
-                    column_type = f"ENUM({','.join(enum_values)})"
-                if column_type.startswith('CHAR') or column_type.startswith('VAR') or column_type == 'BINARY':
-                    column_length = random.randint(1, 30)
-                    column_type = f"{column_type}({column_length})"
-                if column_type == 'VECTOR':
-                    column_length = random.randint(1, 10)
-                    column_type = f"VECTOR({column_length})"
-                column_types.append(column_type)
-                column_names.append(f'c{i}')
-            
-            test_column_names = column_names[:test_column]
-            other_column_names, other_column_types = column_names[test_column:], column_types[test_column:]
-            
-            # generate test expression
+            self.db_config_list = []
+        floor = 1.0 if config.scheduler == 'uniform' else config.scheduler_floor
+        self.scheduler = Scheduler({OpType.AGGREGATE: self.agg_list, OpType.FUNCTION: self.func_list, OpType.PREDICATE: self.pred_list},
+                                   self.type_list, config.scheduler_decay, floor, config.scheduler_pass_reward)
+
+    def reseed(self, loop: int, *keys):
+        """
+        Seeds the random stream of one part of an iteration from the campaign seed and the loop index, so any
+        iteration is generated again without the ones before it, whichever parts of them were generated.
+        """
+        random.seed(derive_seed(self.seed, loop, *keys))
+
+    def plan_case(self):
+        """
+        Draws the picks of the scheduler for an iteration. They depend on the outcomes of the earlier iterations
+        unless the scheduler is uniform, so they are kept with the case to replay it.
+        """
+        test_column = random.randint(1, config.test_column_cnt)
+        other_column = random.randint(0, config.other_column_cnt)
+        op_type = self.scheduler.sample_op_type()
+
+        # select target operations, all of the same type so they share the derived table
+        if op_type in [OpType.AGGREGATE, OpType.PREDICATE]:
+            other_column = max(1, other_column)
+        ops = self.scheduler.sample_ops(op_type, max(1, config.exprs_per_table))
+        seed_types = [self.scheduler.sample_type() for _ in range(test_column + other_column)]
+        return {'op_type': op_type.name, 'ops': ops, 'test_column': test_column, 'seed_types': seed_types}
+
+    def generate_case(self, loop: int, materialize: bool = False, plan: dict = None):
+        """
+        Returns the case of an iteration, with the picks of plan if given. Its rows and select pairs are only generated
+        up front if materialize is set, otherwise the worker generates them when it gets there, with the resolved derived types.
+        """
+        self.reseed(loop)
+        if plan is None:
+            plan = self.plan_case()
+        op_type, ops, test_column, seed_types = OpType[plan['op_type']], plan['ops'], plan['test_column'], plan['seed_types']
+
+        # generate column types and names in original table
+        self.reseed(loop, 'types')
+        column_types = [self.sql_generator.expr_generator.describe(seed_type).instantiate() for seed_type in seed_types]
+        column_names = [f'c{i}' for i in range(len(seed_types))]
+
+        # generate test expressions
+        tests = []
+        for op in ops:
             try:
-                test_expr = generate_equal_expr(op, op_type, column_types, test_column_names)
+                tests.append({'op': op, 'expr': generate_equal_expr(op, op_type, column_types, column_names[:test_column])})
             except ValueError as e:
                 continue
 
-            # create database and original table
-            conn = get_conn(target, f'database{loop}')
-            ori_table, derived_table = 't0', 't1'
+        case = {'loop': loop, 'plan': plan, 'op_type': op_type, 'ops': ops, 'test_column': test_column, 'seed_types': seed_types,
+                'column_types': column_types, 'column_names': column_names, 'rows': None, 'tests': tests}
+        if materialize and tests:
+            case['rows'] = self.generate_rows(loop, column_types)
+            test_column_types = column_types[:test_column]
+            other_column_names, other_column_types = column_names[test_column:], column_types[test_column:]
+            for test in tests:
+                expr_type = self.type_hint(op_type, test['op'], test_column_types)
+                # the hint depends on what the workers saw before, a replay generates the selects with it again
+                plan.setdefault('select_types', {})[test['op']] = expr_type
+                selects = self.generate_selects(loop, test['op'], op_type, expr_type, other_column_names, other_column_types)
+                test['selects'] = [(kind, select.bind(ORI_TABLE, DERIVED_TABLE, test['expr']) if kind == 'pair' else select)
+                                   for kind, select in selects]
+        return case
+
+    def generate_rows(self, loop: int, column_types: list):
+        """Values of the rows of the original table, the first one is inserted alone to check the column types."""
+        self.reseed(loop, 'rows')
+        return self.sql_generator.generate_insert_rows(column_types, 1 + random.randint(1, config.max_row_cnt))
+
+    def type_hint(self, op_type: OpType, op: str, test_column_types: list):
+        """
+        The type of the derived column as recorded by the workers. Until a worker has seen it, the first test
+        column type stands in for it (a boolean for predicates): it only shapes the constants compared with it.
+        """
+        derived_type = self.derived_types.get(op, test_column_types) if self.derived_types is not None else None
+        if derived_type is None:
+            derived_type = 'BOOLEAN' if op_type == OpType.PREDICATE else test_column_types[0]
+        try:
+            self.sql_generator.expr_generator.generate_random_value(derived_type)
+        except ValueError:
+            derived_type = None
+        return derived_type
+
+    def generate_selects(self, loop: int, op: str, op_type: OpType, expr_type: str, other_column_names: list,
+                         other_column_types: list):
+        """Lazily yields the statements of the test of op: ('set', set_statement) or ('pair', select_pair)."""
+        self.reseed(loop, 'selects', op)
+        sql_generator = self.sql_generator
+        for i in range(config.select_cnt):
+            # experimental: randomly add set statement, only for mysql currently
+            if self.target == 'mysql' and random.random() < 0.1:
+                yield 'set', sql_generator.generate_set(self.db_config_list)
+
+            if op_type == OpType.AGGREGATE:
+                yield 'pair', sql_generator.build_agg_select(expr_type, other_column_names, other_column_types)
+            elif op_type == OpType.FUNCTION:
+                yield 'pair', sql_generator.build_func_select(expr_type, other_column_names, other_column_types)
+            elif op_type == OpType.PREDICATE:
+                yield 'pair', sql_generator.build_pred_select(expr_type, other_column_names, other_column_types)
+
+
+class Worker:
+    """
+    Runs the generate/insert/derive/compare loop for one target.
+
+    Every worker owns a disjoint slice of the loop indices (worker_id + 1, worker_id + 1 + worker_cnt, ...),
+    so database names and output files never collide between workers running in parallel.
+    """
+
+    def __init__(self, args: argparse.Namespace, worker_id: int, seed: int, store_path: str, report, cases=None,
+                 feedback=None, progress: Progress = None):
+        self.target = args.target
+        self.worker_id = worker_id
+        self.worker_cnt = max(1, args.workers)
+        self.pair_mode = args.pair_mode
+        self.seed = seed
+        self.store_path = store_path
+        self.report = report
+        # queue of the cases generated by the producer processes, None if the worker generates its own cases
+        self.cases = cases
+        # outcome queues of the producer processes, the scheduler of the worker learns from the outcomes otherwise
+        self.feedback = feedback
+        for queue in feedback or []:
+            # outcomes a finished producer no longer reads must not keep the worker from exiting
+            queue.cancel_join_thread()
+        # loops finished before the campaign was resumed, None to run the loops given by --replay
+        self.progress = progress
+        self.replay = args.replay
+        self.plan = json.loads(args.plan) if args.plan else None
+        self.generator = CaseGenerator(self.target, seed=seed)
+        # the case being run, reported with its plan if the worker crashes
+        self.case = None
+        # a worker generating its own cases saves the state of its scheduler with the campaign checkpoint
+        self.checkpoint = None
+        if cases is None and progress is not None:
+            self.checkpoint = StateFile(get_checkpoint_path(self.target, f'worker{worker_id}'), config.checkpoint_interval)
+            state = self.checkpoint.load()
+            if state is not None:
+                self.generator.scheduler.load(state)
+
+    def loops(self):
+        if self.replay:
+            return self.replay
+        return (loop for loop in range(self.worker_id + 1, config.max_loop + 1, self.worker_cnt)
+                if self.progress is None or not self.progress.is_done(loop))
+
+    def run(self):
+        logger.info(f'Worker {self.worker_id} started, campaign seed: {self.seed}')
+        random.seed(derive_seed(self.seed, self.worker_id))
+        self.pool = get_pool(self.target, f'database{self.worker_id}', config.schema_pool_size)
+        # replayed loops take their original table from their plan, never from another replayed loop
+        self.fixtures = FixtureCache(self.pool, 0 if self.replay else config.fixture_cache_size)
+        self.executor = ThreadPoolExecutor(max_workers=1) if self.pair_mode == 'concurrent' else None
+        self.validity = None
+        self.derived_types = None
+        self.store = None
+        try:
+            self.validity = ValidityCache(config.validity_cache, self.target, self.pool.admin.server_version(),
+                                          config.validity_min_failures)
+            self.derived_types = DerivedTypeCache(config.derived_type_cache, self.target)
+            # replayed findings are always written in full, their signatures are only indexed in the replay store
+            self.store = FindingStore(self.store_path, self.target, self.worker_id,
+                                      self.store_path if self.replay else config.signature_index)
+            if self.cases is None:
+                cases = (self.generator.generate_case(loop, plan=self.plan) for loop in self.loops())
+            else:
+                cases = iter(self.cases.get, None)
+            for case in cases:
+                self.case = case
+                status = self.run_case(case)
+                self.case = None
+                outcome = Scheduler.outcome(case)
+                if self.feedback is None:
+                    self.generator.scheduler.update(outcome)
+                    if self.checkpoint is not None:
+                        self.checkpoint.save(self.generator.scheduler.state())
+                else:
+                    self.feedback[case['producer']].put(outcome)
+                self.report({'worker': self.worker_id, 'loop': case['loop'], 'status': status, **self.stats,
+                             'phases': self.clock.phases})
+        finally:
+            self.close()
+
+    def close(self):
+        if self.cases is None:
+            logger.info(f'Worker {self.worker_id} scheduler, {self.generator.scheduler.summary()}')
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.generator.scheduler.state(), force=True)
+        if self.store is not None:
+            self.store.close()
+        if self.validity is not None:
+            self.validity.close()
+        if self.derived_types is not None:
+            self.derived_types.close()
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.fixtures.close()
+        self.pool.close()
+
+    def log_finding(self, sz: int, op: str, ori_res: list, dest_res: list, insert_res: list, name: str, loop: int,
+                    column_types: list):
+        """
+        Hands the finding of an iteration, if any, to the background writer of the findings store.
+        Returns the signature of the finding, None if there is none.
+        """
+        finding = collect_res(sz, op, ori_res, dest_res, insert_res, name)
+        if finding is None:
+            return None
+        self.store.submit(finding, loop, column_types, self.case['plan'])
+        return finding_signature(finding, column_types)[0]
+
+    def log_latency(self, sz: int, op: str, create_res, derived_res, insert_res: list, base_select: str, equal_select: str,
+                    timings: dict, name: str, loop: int, column_types: list):
+        """Hands a latency divergence to the findings store like log_finding, returns its signature."""
+        finding = collect_latency(sz, op, create_res, derived_res, insert_res, base_select, equal_select, timings, name)
+        self.store.submit(finding, loop, column_types, self.case['plan'])
+        return finding_signature(finding, column_types)[0]
+
+    def execute_pair(self, conn, base_select: str, equal_select: str, keep_rows: bool = True):
+        """Executes a base/equal select pair, at the same time over two sessions in concurrent pair mode."""
+        if self.pair_mode == 'concurrent':
+            future = self.executor.submit(conn.get_peer().execute_timed, equal_select, keep_rows)
+            res1 = conn.execute_timed(base_select, keep_rows)
+            return res1, future.result()
+        return conn.execute_timed(base_select, keep_rows), conn.execute_timed(equal_select, keep_rows)
+
+    def time_pair(self, conn, base_select: str, equal_select: str):
+        """
+        Times a pair whose first run diverged in latency again, config.latency_runs times with the two selects
+        alternating on one session. Returns the timings if the fastest runs still differ by config.latency_ratio.
+        """
+        base_times, equal_times = [], []
+        for _ in range(config.latency_runs):
+            for times, select in [(base_times, base_select), (equal_times, equal_select)]:
+                res = conn.execute_timed(select, keep_rows=False)
+                if res.is_error():
+                    return None
+                times.append(res.elapsed)
+        if not latency_diverges(min(base_times), min(equal_times)):
+            return None
+        return {'base': base_times, 'equal': equal_times}
+
+    def batch_statements(self, statements):
+        """
+        Groups the statements into the batches sent at once: single statements unless in batch pair mode.
+        A set statement always starts a new batch, so a mismatching pair is fetched again under the same settings.
+        """
+        batch_size = config.batch_pairs if self.pair_mode == 'batch' else 1
+        batch = []
+        for statement in statements:
+            if batch and (len(batch) >= batch_size or statement[0] == 'set'):
+                yield batch
+                batch = []
+            batch.append(statement)
+        if batch:
+            yield batch
+
+    def execute_statements(self, conn, batch: list, keep_rows: bool):
+        """Executes a batch of statements and returns a (base, equal) result pair per statement."""
+        if self.pair_mode == 'batch':
+            results = iter(conn.execute_batch([sql for statement in batch for sql in statement[1:]], keep_rows))
+            return [(res, res) if statement[0] == 'set' else (res, next(results))
+                    for statement, res in zip(batch, results)]
+        pairs = []
+        for statement in batch:
+            if statement[0] == 'set':
+                set_statement = statement[1]
+                res = peer_res = conn.execute(set_statement)
+                # settings are per session, so both sessions of a concurrent pair apply them
+                if self.pair_mode == 'concurrent':
+                    peer_res = conn.get_peer().execute(set_statement)
+                logger.info(f"Executed configuration modification: {set_statement}")
+                pairs.append((res, peer_res))
+            else:
+                pairs.append(self.execute_pair(conn, statement[1], statement[2], keep_rows))
+        return pairs
+
+    def run_case(self, case: dict):
+        """
+        Runs the case of an iteration and returns its status: 'invalid', 'skipped', 'early_stop', 'passed' or 'finding'.
+        The op type, the early stop reason and the number of pairs are left in self.stats, the phase timings in self.clock.
+        """
+        target = self.target
+        loop, op_type, test_column = case['loop'], case['op_type'], case['test_column']
+        column_types, column_names, tests = case['column_types'], case['column_names'], case['tests']
+        self.stats = {'op_type': op_type.name.lower(), 'reason': None, 'pairs': 0, 'fixture_hit': False, 'timeouts': 0}
+        self.clock = PhaseClock()
+        if not tests:
+            self.stats['reason'] = 'invalid_expr'
+            return 'invalid'
+
+        # reuse a populated original table with the same column types, lengths and enum values aside. The plan keeps
+        # the loop that generated its rows and its column types, so a replay builds the same table again
+        plan = case['plan']
+        rows_loop = loop
+        fixture_key = tuple(normalize_type(column_type) for column_type in column_types)
+        fixture = None
+        if 'fixture' in plan:
+            rows_loop, column_types = plan['fixture']['loop'], list(plan['fixture']['column_types'])
+        else:
+            fixture = self.fixtures.get(fixture_key)
+            if fixture is not None:
+                column_types = list(fixture.column_types)
+                plan['fixture'] = {'loop': fixture.loop, 'column_types': column_types}
+
+        other_column_names, other_column_types = column_names[test_column:], column_types[test_column:]
+
+        # skip combinations known to be invalid before touching the server
+        test_column_types = column_types[:test_column]
+        derived_column_types = get_derived_combination(op_type, test_column_types, other_column_types)
+        valid_tests = []
+        for test in tests:
+            if self.validity.is_invalid(test['op'], test_column_types) or self.validity.is_invalid(test['op'], derived_column_types):
+                logger.info(f"Skip known invalid combination, op: {test['op']}, type: {column_types}")
+            else:
+                valid_tests.append(test)
+        tests = valid_tests
+        if not tests:
+            self.stats['reason'] = 'known_invalid'
+            return 'skipped'
+
+        # use the cached original table, or take a recycled database and create one
+        self.clock.start('setup')
+        cached = fixture is not None
+        self.stats['fixture_hit'] = cached
+        ori_table, derived_table = ORI_TABLE, DERIVED_TABLE
+        if cached:
+            conn = fixture.conn
+            ori_res, dest_res, insert_res = [fixture.create_res], [], list(fixture.insert_res)
+        else:
+            conn = self.pool.acquire()
             ori_res, dest_res, insert_res = [], [], []
-            sql_generator = SQLGenerator(target)
-            conn.execute(sql_generator.generate_drop(ori_table))
-            res = conn.execute(sql_generator.generate_create(target, ori_table, column_types, column_names))
-            ori_res.append(res)
-
-            # test if the test expression is valid
-            res1 = conn.execute(sql_generator.generate_insert(ori_table, column_types, column_names))
-            insert_res.append(res1)
-            res2 = conn.execute(f'SELECT {test_expr} FROM {ori_table}')
-            if res1.is_error():
-                logger.info(f'Early stop, reason: Failed to insert data into {ori_table}: {res1.error_msg}, sql: {res1.sql}')
-                conn.close()
-                continue
-            if res2.is_error():
-                logger.info(f'Early stop, reason: Failed to select data from {ori_table}: {res2.error_msg}, sql: {res2.sql}')
-                conn.close()
-                continue
+        test = tests[0]
+        try:
+            sql_generator = self.generator.sql_generator
+            if not cached:
+                res = conn.execute(sql_generator.generate_create(target, ori_table, column_types, column_names))
+                ori_res.append(res)
+            self.clock.start('insert')
+            if not cached:
+                rows = case['rows'] or self.generator.generate_rows(rows_loop, column_types)
+                res1 = conn.execute(sql_generator.generate_bulk_insert(ori_table, column_names, rows[:1]))
+                insert_res.append(res1)
+                if res1.is_error():
+                    logger.info(f'Early stop, reason: Failed to insert data into {ori_table}: {res1.error_msg}, sql: {res1.sql}')
+                    self.stats['reason'] = 'insert'
+                    return 'early_stop'
 
-            # insert data into original table
-            for i in range(random.randint(1, 30)):
-                res = conn.execute(sql_generator.generate_insert(ori_table, column_types, column_names))
-                insert_res.append(res)
-            
-            # create and store data in derived table
-            conn.execute(sql_generator.generate_drop(derived_table))
-            try:
-                construct_derived_table(conn, target, ori_table, derived_table, other_column_names, other_column_types, test_expr, op_type, dest_res, insert_res)
-            except ValueError as e:
-                logger.info(f'Early stop, reason: Failed to create derived table {derived_table}: {e}')
-                conn.close()
-                continue
+                # insert data into original table and keep it for later iterations with the same column types,
+                # before the probes so that the table is reused even if none of the test expressions is valid
+                insert_rows(conn, sql_generator, ori_table, column_names, rows[1:], insert_res)
+                cached = self.fixtures.put(fixture_key, conn, column_types, ori_res[0], insert_res, rows_loop)
+
+            # test if the test expressions are valid
+            for test in tests:
+                test['probe'] = res2 = conn.execute(f"SELECT {test['expr']} FROM {ori_table}")
+                if res2.is_error():
+                    logger.info(f'Early stop, reason: Failed to select data from {ori_table}: {res2.error_msg}, sql: {res2.sql}')
+                    self.validity.add_invalid(test['op'], test_column_types, res2.error_code, res2.error_msg)
+                else:
+                    self.validity.add_valid(test['op'], test_column_types)
+            tests = [test for test in tests if not test['probe'].is_error()]
+            if not tests:
+                self.stats['reason'] = 'probe'
+                return 'early_stop'
 
-            # generate equivalent select statement and check the consistency
-            print(f'testing type: {column_types}, op: {op}')
-            expr_col = 'c0'
+            # create and store data in derived table, one column per test expression
+            self.clock.start('derived')
+            for k, test in enumerate(tests):
+                test['column'] = derived_column_name(k)
+                test['type'] = lookup_derived_type(target, test['op'], test_column_types, test['probe'])
+            dest_cnt, insert_cnt = len(dest_res), len(insert_res)
             try:
-                expr_type = get_derived_type(conn, target, derived_table, expr_col)
+                construct_derived_table(conn, target, ori_table, derived_table, other_column_names, other_column_types, [test['expr'] for test in tests], op_type, dest_res, insert_res, [test['type'] for test in tests])
             except ValueError as e:
-                logger.info(f'Early stop, reason: Failed to get data type of {expr_col} in {derived_table}: {e}')
-                conn.close()
-                continue
+                if len(tests) == 1:
+                    logger.info(f'Early stop, reason: Failed to create derived table {derived_table}: {e}')
+                    self.stats['reason'] = 'derived_table'
+                    failed = [r for r in dest_res + insert_res[-1:] if r.is_error()]
+                    self.validity.add_invalid(tests[0]['op'], derived_column_types, failed[-1].error_code if failed else None, str(e))
+                    return 'early_stop'
+                # the failing expression is unknown, fall back to the first one alone
+                logger.info(f'Failed to create derived table {derived_table} for {len(tests)} expressions, retry with the first one: {e}')
+                del dest_res[dest_cnt:], insert_res[insert_cnt:]
+                conn.execute(sql_generator.generate_drop(derived_table))
+                tests = tests[:1]
+                try:
+                    construct_derived_table(conn, target, ori_table, derived_table, other_column_names, other_column_types, [tests[0]['expr']], op_type, dest_res, insert_res, [tests[0]['type']])
+                except ValueError as e:
+                    logger.info(f'Early stop, reason: Failed to create derived table {derived_table}: {e}')
+                    self.stats['reason'] = 'derived_table'
+                    failed = [r for r in dest_res + insert_res[-1:] if r.is_error()]
+                    self.validity.add_invalid(tests[0]['op'], derived_column_types, failed[-1].error_code if failed else None, str(e))
+                    return 'early_stop'
+            if derived_column_types != test_column_types:
+                for test in tests:
+                    self.validity.add_valid(test['op'], derived_column_types)
 
-            for i in range(config.select_cnt):
-                # experimental: randomly add set statement, only for mysql currently
-                if target == 'mysql' and random.random() < 0.1:  
-                    set_statement = sql_generator.generate_set(db_config_list) 
+            # generate equivalent select statements and check the consistency, one derived column after the other
+            print(f"testing type: {column_types}, op: {', '.join(test['op'] for test in tests)}")
+            self.clock.start('type')
+            for test in tests:
+                try:
+                    test['type'] = resolve_derived_type(conn, target, test['op'], test_column_types, test['probe'], derived_table, test['column'])
+                    self.derived_types.add(test['op'], test_column_types, test['type'])
+                    # the type is used to generate constants compared with the derived column
+                    sql_generator.expr_generator.generate_random_value(test['type'])
+                except ValueError as e:
+                    logger.info(f"Failed to get a usable data type of {test['column']} in {derived_table}: {e}")
+                    test['type'] = None
+            tests = [test for test in tests if test['type'] is not None]
+            if not tests:
+                logger.info(f'Early stop, reason: Failed to get data type of the derived columns in {derived_table}')
+                self.stats['reason'] = 'derived_type'
+                return 'early_stop'
+
+            self.clock.start('select')
+            if self.pair_mode == 'concurrent':
+                # the peer session only sees committed data
+                conn.commit()
+            create_res, derived_res = ori_res[0], dest_res[-1]
+            # in digest mode only the digests are compared, the rows are fetched again when they differ
+            keep_rows = config.compare_mode != 'digest'
+            for test in tests:
+                op, test_expr, expr_col, expr_type = test['op'], test['expr'], test['column'], test['type']
+                test['ori_res'] = ori_res = [create_res]
+                test['dest_res'] = dest_res = [derived_res]
+                test['pairs'] = 0
+                # the select pairs of a produced case were generated with a type hint, the others with the resolved type
+                selects = test.get('selects')
+                if selects is None:
+                    select_type = plan['select_types'].get(op) if 'select_types' in plan else expr_type
+                    selects = self.generator.generate_selects(loop, op, op_type, select_type, other_column_names, other_column_types)
+                statements = (('pair', *statement[1].render(ori_table, derived_table, test_expr, expr_col)) if statement[0] == 'pair' else statement
+                              for statement in selects)
+                mismatch = False
+                for batch in self.batch_statements(statements):
                     try:
-                        res = conn.execute(set_statement)
-                        logger.info(f"Executed configuration modification: {set_statement}")
+                        results = self.execute_statements(conn, batch, keep_rows)
                     except Exception as e:
-                        logger.error(f"Error executing configuration modification: {set_statement}, error: {str(e)}")
-                    ori_res.append(res)
-                    dest_res.append(res)
+                        logger.error(f"SQL execution error in loop {loop}: {str(e)}")
+                        self.log_finding(test_column, op, ori_res, dest_res, insert_res, f'crash_test_{target}_{loop}_error', loop, column_types)
+                        continue
+                    for statement, (res1, res2) in zip(batch, results):
+                        ori_res.append(res1)
+                        dest_res.append(res2)
+                        if statement[0] == 'set':
+                            continue
+                        self.stats['pairs'] += 1
 
-                if op_type == OpType.AGGREGATE:
-                    base_select, equal_select = sql_generator.generate_agg_select(ori_table, derived_table, test_expr, expr_type, expr_col, other_column_names, other_column_types)
-                elif op_type == OpType.FUNCTION:
-                    base_select, equal_select = sql_generator.generate_func_select(ori_table, derived_table, test_expr, expr_type, expr_col, other_column_names, other_column_types)
-                elif op_type == OpType.PREDICATE:
-                    base_select, equal_select = sql_generator.generate_pred_select(ori_table, derived_table, test_expr, expr_type, expr_col, other_column_names, other_column_types)
+                        if res1.blacklisted or res2.blacklisted:
+                            logger.info(f'Skipping blacklisted error: {res1.error_msg or res2.error_msg}')
+                            res1.compact()
+                            res2.compact()
+                            continue
+                        if res1.is_timeout() or res2.is_timeout():
+                            logger.info(f'Skipping timed out pair: {res1.error_msg if res1.is_timeout() else res2.error_msg}')
+                            self.stats['timeouts'] += 1
+                            res1.compact()
+                            res2.compact()
+                            continue
 
-                try:
-                    # Execute and check results
-                    res1 = conn.execute(base_select)
-                    res2 = conn.execute(equal_select)
-                    ori_res.append(res1)
-                    dest_res.append(res2)
-                    
-                    if res1.blacklisted or res2.blacklisted:
-                        logger.info(f'Skipping blacklisted error: {res1.error_msg or res2.error_msg}')
-                        continue
-                    
-                    if res1 != res2:
+                        test['pairs'] += 1
+                        if res1 != res2:
+                            if not keep_rows:
+                                ori_res[-1], dest_res[-1] = self.execute_pair(conn, statement[1], statement[2])
+                            mismatch = True
+                            break
+                        # equal results of very different cost, reported once per test
+                        if 'latency' not in test and not res1.is_error() and latency_diverges(res1.elapsed, res2.elapsed):
+                            timings = self.time_pair(conn, statement[1], statement[2])
+                            if timings is not None:
+                                test['latency'] = self.log_latency(test_column, op, create_res, derived_res, insert_res,
+                                                                   statement[1], statement[2], timings,
+                                                                   f"latency_{target}_{loop}_{test['column']}", loop, column_types)
+                        # only mismatching pairs keep their rows for the report
+                        res1.compact()
+                        res2.compact()
+                    if mismatch:
                         break
+        except Exception:
+            if len(ori_res) > 1:
+                self.log_finding(test_column, test['op'], ori_res, dest_res, insert_res, f'crash_test_{target}_{loop}_main_error', loop, column_types)
+            # the state of the database is unknown, do not reuse it
+            if cached:
+                self.fixtures.pop(fixture_key)
+                cached = False
+            raise
+        finally:
+            self.clock.start('setup')
+            if not cached:
+                self.pool.release(conn)
+            elif not conn.reset(tables=('t1',)):
+                self.fixtures.evict(fixture_key)
+            self.clock.stop()
+
+        status = 'passed'
+        for k, test in enumerate(tests):
+            name = f'test_{target}_{loop}' if len(tests) == 1 else f'test_{target}_{loop}_{k}'
+            signature = self.log_finding(test_column, test['op'], test['ori_res'], test['dest_res'], insert_res, name, loop, column_types)
+            signature = signature or test.get('latency')
+            if signature is not None:
+                status = 'finding'
+            # tests that stopped before comparing pairs keep no reward
+            test['reward'] = self.generator.scheduler.test_reward(signature, test['pairs'], config.select_cnt)
+        return status
+
+
+class Collector:
+    """Aggregates the iteration reports sent by the workers in the parent process."""
+
+    def __init__(self, target: str, metrics_port: int = None, seed: int = None, progress: Progress = None):
+        self.target = target
+        self.seed = seed
+        # finished loops, saved to the campaign checkpoint every config.checkpoint_interval seconds
+        self.progress = progress
+        self.checkpoint = StateFile(get_checkpoint_path(target, 'campaign'), config.checkpoint_interval) if progress is not None else None
+        self.start = time.time()
+        self.status_cnt = {}
+        self.metrics = Metrics(target)
+        self.metrics_path = config.metrics_path.format(target=target)
+        self.flushed = time.time()
+        self.server = self.metrics.serve(metrics_port) if metrics_port else None
+
+    def handle(self, report: dict):
+        status = report['status']
+        self.status_cnt[status] = self.status_cnt.get(status, 0) + 1
+        self.metrics.observe(report)
+        if self.progress is not None and report.get('loop') is not None:
+            self.progress.add(report['loop'], crashed=status == 'crash')
+        self.tick()
+        if status == 'finding':
+            logger.info(f"Worker {report['worker']} found a discrepancy in loop {report['loop']}")
+        elif status == 'crash':
+            logger.error(f"Worker {report['worker']} crashed in loop {report.get('loop')}: {report['error']}")
+
+    def tick(self):
+        """Rewrites the metrics file once every config.metrics_interval seconds."""
+        if time.time() - self.flushed >= config.metrics_interval:
+            self.flush()
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.campaign_state())
+
+    def campaign_state(self):
+        return {'target': self.target, 'seed': self.seed, **self.progress.state()}
+
+    def flush(self):
+        self.flushed = time.time()
+        try:
+            self.metrics.flush(self.metrics_path)
+        except OSError as e:
+            logger.error(f'Failed to write metrics to {self.metrics_path}: {e}')
+
+    def close(self):
+        self.flush()
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.campaign_state(), force=True)
+        if self.server is not None:
+            self.server.shutdown()
+
+    def summary(self):
+        elapsed = max(time.time() - self.start, 1e-6)
+        total = sum(cnt for status, cnt in self.status_cnt.items() if status not in ['crash', 'exit'])
+        return f'{self.target}: {total} iterations in {elapsed:.1f}s ({total / elapsed:.2f}/s), {self.status_cnt}, seed {self.seed}'
 
-                except Exception as e:
-                    logger.error(f"SQL execution error in loop {loop}: {str(e)}")
-                    log_res(test_column, op, ori_res, dest_res, insert_res, f'crash_test_{target}_{loop}_error', out_path)
-                    continue 
 
-            conn.close()
-            log_res(test_column, op, ori_res, dest_res, insert_res, f'test_{target}_{loop}', out_path)
+def setup_logger(log_path: str, debug: bool):
+    logger.remove()
+    logger.add(sys.stderr, level='ERROR')
+    if debug:
+        logger.add(log_path + 'error_{time}.log',
+                    format='{time} {level} {message}',
+                    level='ERROR',
+                    rotation='10 MB',
+                    compression='zip')
+        logger.add(log_path + 'info_{time}.log',
+                    format='{time} {level} {message}',
+                    level='INFO',
+                    rotation='50 MB',
+                    compression='zip')
 
+
+def get_store_path(target: str, name: str = 'findings'):
+    return f'../res/{target}/{name}.db'
+
+
+def get_checkpoint_path(target: str, name: str):
+    return os.path.join(config.checkpoint_path.format(target=target), f'{name}.json')
+
+
+def run_producer(args: argparse.Namespace, producer_id: int, seed: int, cases, feedback, progress: Progress):
+    """Generates the cases of its slice of the loop indices into the bounded case queue, blocking while it is full."""
+    setup_logger(f'../log/{args.target}/producer{producer_id}/', args.debug)
+    derived_types = None
+    try:
+        random.seed(derive_seed(seed, 'producer', producer_id))
+        derived_types = DerivedTypeCache(config.derived_type_cache, args.target)
+        generator = CaseGenerator(args.target, derived_types, seed)
+        checkpoint = StateFile(get_checkpoint_path(args.target, f'producer{producer_id}'), config.checkpoint_interval)
+        state = checkpoint.load()
+        if state is not None:
+            generator.scheduler.load(state)
+        for loop in range(producer_id + 1, config.max_loop + 1, args.producers):
+            if progress.is_done(loop):
+                continue
+            # learn from the outcomes the workers sent back so far
+            while True:
+                try:
+                    generator.scheduler.update(feedback.get_nowait())
+                except Empty:
+                    break
+            checkpoint.save(generator.scheduler.state())
+            case = generator.generate_case(loop, materialize=True)
+            case['producer'] = producer_id
+            cases.put(case)
+        checkpoint.save(generator.scheduler.state(), force=True)
+        logger.info(f'Producer {producer_id} scheduler, {generator.scheduler.summary()}')
     except Exception as e:
-        logger.error(f"Main error: {e}")
+        logger.error(f"Producer {producer_id} error: {e}")
         logger.error(traceback.format_exc())
+    finally:
+        if derived_types is not None:
+            derived_types.close()
+
+
+def start_producers(args: argparse.Namespace, seed: int, cases, feedback: list, progress: Progress):
+    producers = [multiprocessing.Process(target=run_producer, args=(args, i, seed, cases, feedback[i], progress), daemon=True)
+                 for i in range(args.producers)]
+    for producer in producers:
+        producer.start()
+
+    def end_cases():
+        # every worker stops at its own end marker once all producers are done
+        for producer in producers:
+            producer.join()
+        for _ in range(max(1, args.workers)):
+            cases.put(None)
+
+    threading.Thread(target=end_cases, name='case-end', daemon=True).start()
+    return producers
+
+
+def run_worker(args: argparse.Namespace, worker_id: int, seed: int, report, cases=None, feedback=None,
+               progress: Progress = None):
+    target = args.target
+    if args.workers > 1:
+        log_path = f'../log/{target}/worker{worker_id}/'
+    else:
+        log_path = f'../log/{target}/'
+    setup_logger(log_path, args.debug)
 
-        if 'base_select' in locals() and 'equal_select' in locals():
-            log_res(test_column, op, ori_res, dest_res, insert_res, f'crash_test_{target}_main_error', out_path)
+    worker = None
+    try:
+        worker = Worker(args, worker_id, seed, get_store_path(target, 'replay' if args.replay else 'findings'), report,
+                        cases, feedback, progress)
+        worker.run()
+    except Exception as e:
+        logger.error(f"Worker {worker_id} error: {e}")
+        logger.error(traceback.format_exc())
+        case = worker.case if worker is not None else None
+        if case is not None:
+            logger.error(f"Replay the loop with: python main.py {target} --seed {seed} --replay {case['loop']} "
+                         f"--plan '{json.dumps(case['plan'])}'")
+        report({'worker': worker_id, 'status': 'crash', 'error': repr(e), 'loop': case['loop'] if case is not None else None})
     finally:
+        report({'worker': worker_id, 'status': 'exit'})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('target', type=str, help='The target database name, support mysql, mariadb, tidb, clickhouse')
+    parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes, each with its own databases')
+    parser.add_argument('--pair-mode', choices=['serial', 'concurrent', 'batch'], default='serial',
+                        help='Run the base and equivalent select of a pair one after the other, at the same time over '
+                             'two sessions, or several pairs per request')
+    parser.add_argument('--producers', type=int, default=0,
+                        help='Number of processes generating the test cases for the workers, 0 to let every worker generate its own')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Also serve the metrics in the Prometheus text format on this localhost port')
+    parser.add_argument('--seed', type=int, default=None, help='Campaign seed, config.seed by default')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue the campaign of the last checkpoint, with its seed, findings store and scheduler state')
+    parser.add_argument('--replay', type=int, nargs='+', default=None,
+                        help='Only run these loops of the campaign, in one worker, writing findings to ../res/{db}/replay.db')
+    parser.add_argument('--plan', type=str, default=None,
+                        help='Scheduler picks of the replayed loop as logged with its finding or crash, as JSON')
+    args = parser.parse_args()
+    if args.plan and (not args.replay or len(args.replay) > 1):
+        parser.error('--plan needs exactly one --replay loop')
+    if args.replay and not args.plan and config.scheduler != 'uniform':
+        # a fresh adaptive scheduler would pick other op types, ops and column types than the campaign did
+        parser.error(f"--replay needs the --plan of the loop unless scheduler = 'uniform', the {config.scheduler} "
+                     f"scheduler picks depend on the loops before")
+    if args.resume and (args.seed is not None or args.replay):
+        parser.error('--resume takes the seed and the loops from the checkpoint')
+    if args.replay:
+        # replayed loops are generated and run in this process
+        args.workers, args.producers = 1, 0
+
+    target = args.target
+    log_path = f'../log/{target}/'
+
+    seed = config.seed if args.seed is None else args.seed
+    progress = None
+    if args.resume:
+        checkpoint_path = get_checkpoint_path(target, 'campaign')
+        state = StateFile(checkpoint_path, config.checkpoint_interval).load()
+        if state is None:
+            raise ValueError(f'No checkpoint to resume from: {checkpoint_path}')
+        seed, progress = state['seed'], Progress.from_state(state)
+        print(f'Resuming campaign {seed}: {progress.count()} loops done, crashed loops: {progress.crashed}')
+    elif args.replay:
+        rotate_store(get_store_path(target, 'replay'))
+    else:
+        rotate_store(get_store_path(target))
+        clean_dir(config.checkpoint_path.format(target=target))
+        progress = Progress(args.producers or max(1, args.workers))
+    collector = Collector(target, args.metrics_port, seed, progress)
+    # with producers, the workers only execute the cases taken from a bounded queue
+    cases = multiprocessing.Queue(maxsize=config.case_queue_size) if args.producers > 0 else None
+    # outcomes of the cases of every producer, sent back by the workers for its scheduler
+    feedback = [multiprocessing.Queue() for _ in range(args.producers)] if cases is not None else None
+    producers = start_producers(args, seed, cases, feedback, progress) if cases is not None else []
+    if args.workers <= 1:
         try:
-            if conn:
-                conn.close()
-        except:
+            run_worker(args, 0, seed, collector.handle, cases, feedback, progress)
+        except KeyboardInterrupt:
             pass
+    else:
+        setup_logger(log_path, args.debug)
+        queue = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=run_worker, args=(args, i, seed, queue.put, cases, feedback, progress))
+                   for i in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        running = len(workers)
+        try:
+            while running > 0:
+                try:
+                    report = queue.get(timeout=1)
+                except Empty:
+                    collector.tick()
+                    if not any(worker.is_alive() for worker in workers):
+                        break
+                    continue
+                if report['status'] == 'exit':
+                    running -= 1
+                collector.handle(report)
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+        finally:
+            for worker in workers:
+                worker.join()
+    # producers are left blocked on a full queue if the workers stopped early
+    for producer in producers:
+        producer.terminate()
+    collector.close()
+    print(collector.summary())
+
 
 if __name__ == "__main__":
     try:
         main()
     except Exception as e:
         logger.error(f"Critical error: {e}")
-        logger.error(traceback.format_exc())
\ No newline at end of file
+        logger.error(traceback.format_exc())
@@ -0,0 +1,150 @@
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from loguru import logger
+
+
+# upper bounds of the latency histogram buckets, in seconds
+BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60]
+
+
+class PhaseClock:
+    """Attributes the wall time of an iteration to the phase that was running, early stops included."""
+
+    def __init__(self):
+        self.phases = {}
+        self.phase = None
+        self.started = 0
+
+    def start(self, phase: str):
+        now = time.perf_counter()
+        if self.phase is not None:
+            self.phases[self.phase] = self.phases.get(self.phase, 0) + now - self.started
+        self.phase, self.started = phase, now
+
+    def stop(self):
+        self.start(None)
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+
+class Metrics:
+    """
+    Aggregates the iteration reports of all workers into throughput counters and per-phase latency
+    histograms, rendered in the Prometheus text format.
+    """
+
+    def __init__(self, target: str):
+        self.target = target
+        self.start = time.time()
+        self.lock = threading.Lock()
+        self.iterations = {}
+        self.early_stops = {}
+        self.pairs = 0
+        self.fixture_hits = 0
+        self.timeouts = 0
+        self.histograms = {}
+
+    def observe(self, report: dict):
+        if 'phases' not in report:
+            return
+        with self.lock:
+            status = report['status']
+            self.iterations[status] = self.iterations.get(status, 0) + 1
+            self.pairs += report['pairs']
+            self.fixture_hits += report['fixture_hit']
+            self.timeouts += report['timeouts']
+            if report['reason'] is not None:
+                self.early_stops[report['reason']] = self.early_stops.get(report['reason'], 0) + 1
+            for phase, seconds in report['phases'].items():
+                key = (report['op_type'], phase)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram()
+                self.histograms[key].observe(seconds)
+
+    def render(self):
+        with self.lock:
+            elapsed = max(time.time() - self.start, 1e-6)
+            total = sum(self.iterations.values())
+            target = self.target
+            lines = ['# TYPE edc_iterations_total counter']
+            lines += [f'edc_iterations_total{_labels(target=target, status=status)} {cnt}'
+                      for status, cnt in sorted(self.iterations.items())]
+            lines += ['# TYPE edc_pairs_total counter', f'edc_pairs_total{_labels(target=target)} {self.pairs}',
+                      '# TYPE edc_fixture_hits_total counter',
+                      f'edc_fixture_hits_total{_labels(target=target)} {self.fixture_hits}',
+                      '# TYPE edc_timeouts_total counter',
+                      f'edc_timeouts_total{_labels(target=target)} {self.timeouts}',
+                      '# TYPE edc_early_stops_total counter']
+            lines += [f'edc_early_stops_total{_labels(target=target, reason=reason)} {cnt}'
+                      for reason, cnt in sorted(self.early_stops.items())]
+            lines += ['# TYPE edc_iterations_per_second gauge',
+                      f'edc_iterations_per_second{_labels(target=target)} {total / elapsed:.3f}',
+                      '# TYPE edc_pairs_per_second gauge',
+                      f'edc_pairs_per_second{_labels(target=target)} {self.pairs / elapsed:.3f}',
+                      '# TYPE edc_early_stop_rate gauge']
+            lines += [f'edc_early_stop_rate{_labels(target=target, reason=reason)} {cnt / max(total, 1):.4f}'
+                      for reason, cnt in sorted(self.early_stops.items())]
+            lines.append('# TYPE edc_phase_seconds histogram')
+            for (op_type, phase), histogram in sorted(self.histograms.items()):
+                labels = dict(target=target, op_type=op_type, phase=phase)
+                cumulative = 0
+                for bound, cnt in zip(BUCKETS, histogram.counts):
+                    cumulative += cnt
+                    lines.append(f'edc_phase_seconds_bucket{_labels(**labels, le=bound)} {cumulative}')
+                lines.append(f'edc_phase_seconds_bucket{_labels(**labels, le="+Inf")} {histogram.count}')
+                lines.append(f'edc_phase_seconds_sum{_labels(**labels)} {histogram.sum:.6f}')
+                lines.append(f'edc_phase_seconds_count{_labels(**labels)} {histogram.count}')
+            return '\n'.join(lines) + '\n'
+
+    def flush(self, path: str):
+        """Rewrites the metrics file atomically, so readers never see a partial file."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int):
+        """Serves the metrics on http://127.0.0.1:{port}/metrics from a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ['/', '/metrics']:
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        logger.info(f'Serving metrics on http://127.0.0.1:{port}/metrics')
+        return server
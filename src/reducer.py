@@ -0,0 +1,436 @@
+import os
+import re
+import sys
+import copy
+import time
+import queue
+import sqlite3
+import argparse
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from config import config
+from findings import load_findings
+from util import get_pool, sql_to_file
+from sql.query import DERIVED_TABLE, EXPR, ORI_TABLE, TABLE, derived_column_name, parse
+
+
+# binary operators produced by ExprGenerator.generate_expr_on_column, longest first
+OPERATORS = [' NOT IN ', ' AND ', ' OR ', ' != ', ' <= ', ' IN ', ' = ', ' > ']
+# keywords that end a SELECT/GROUP BY/ORDER BY list
+LIST_ENDS = [' FROM ', ' WHERE ', ' GROUP BY ', ' HAVING ', ' ORDER BY ', ' LIMIT ', ' AS (']
+
+
+################# sql text operation #################
+def find_top_level(s: str, tokens: list, start: int = 0, stop_at_close: bool = False):
+    """
+    Returns the (position, token) of every occurrence of the tokens in s[start:] outside parentheses and
+    string literals. With stop_at_close, the scan ends at the parenthesis that closes the enclosing group.
+    """
+    found, depth, quote, i = [], 0, None, start
+    while i < len(s):
+        ch = s[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in '\'"':
+            quote = ch
+        elif ch in '([{':
+            depth += 1
+        elif ch in ')]}':
+            if depth == 0 and stop_at_close:
+                found.append((i, ch))
+                break
+            depth -= 1
+        elif depth == 0:
+            token = next((t for t in tokens if s.startswith(t, i)), None)
+            if token is not None:
+                found.append((i, token))
+                i += len(token)
+                continue
+        i += 1
+    return found
+
+
+def split_top_level(s: str, tokens: list):
+    parts, start = [], 0
+    for i, token in find_top_level(s, tokens):
+        parts.append(s[start:i])
+        start = i + len(token)
+    parts.append(s[start:])
+    return parts
+
+
+def find_groups(s: str):
+    """Returns the (start, end) spans of the contents of all parenthesized groups in s, outermost first."""
+    groups, stack, quote = [], [], None
+    for i, ch in enumerate(s):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in '\'"':
+            quote = ch
+        elif ch == '(':
+            stack.append(i)
+        elif ch == ')' and stack:
+            groups.append((stack.pop() + 1, i))
+    return sorted(groups)
+
+
+def find_conditions(s: str):
+    """Returns the (start, end) spans of the top-level WHERE and HAVING conditions of a query."""
+    clauses = find_top_level(s, [' WHERE ', ' GROUP BY ', ' HAVING ', ' ORDER BY '])
+    spans = []
+    for k, (i, token) in enumerate(clauses):
+        if token in [' WHERE ', ' HAVING ']:
+            end = clauses[k + 1][0] if k + 1 < len(clauses) else len(s)
+            spans.append((i + len(token), end))
+    return spans
+
+
+def _filter_list(items: list, col: str):
+    return [item for item in items if item.strip().split(' ')[0] != col and not item.strip().endswith(f' AS {col}')]
+
+
+def derived_exprs(sql: str):
+    """Maps the derived columns built by a CREATE TABLE AS or INSERT ... SELECT statement to their test expressions."""
+    start = sql.find('SELECT ')
+    if start < 0:
+        return {}
+    start += len('SELECT ')
+    ends = find_top_level(sql, [' FROM '], start, stop_at_close=True)
+    items = split_top_level(sql[start:ends[0][0] if ends else len(sql)], [','])
+    exprs = {}
+    for k, item in enumerate(items):
+        match = re.fullmatch(r'\((.*)\)(?: AS (\w+))?', item.strip(), re.S)
+        if match:
+            exprs[match.group(2) or derived_column_name(k)] = match.group(1)
+    return exprs
+
+
+def drop_column_def(sql: str, col: str):
+    """Removes the definition of col from the column list of a CREATE TABLE statement, None if none would be left."""
+    groups = find_groups(sql)
+    if not sql.startswith('CREATE TABLE') or not groups or ' AS (' in sql[:groups[0][0]]:
+        return sql
+    start, end = groups[0]
+    items = split_top_level(sql[start:end], [','])
+    kept = _filter_list(items, col)
+    if not kept:
+        return None
+    return sql[:start] + ','.join(kept).strip() + sql[end:]
+
+
+def drop_column_refs(sql: str, col: str):
+    """
+    Removes col from the SELECT, GROUP BY and ORDER BY lists of a statement at any nesting level, along
+    with its 'col AS col' aliases. Returns None if a SELECT list would become empty.
+    """
+    sql = re.sub(rf',\s*{col} AS {col}\b', '', sql)
+    for match in sorted(re.finditer(r'SELECT |GROUP BY |ORDER BY ', sql), key=lambda m: m.start(), reverse=True):
+        start = match.end()
+        ends = find_top_level(sql, LIST_ENDS, start, stop_at_close=True)
+        end = ends[0][0] if ends else len(sql)
+        items = split_top_level(sql[start:end], [','])
+        kept = _filter_list(items, col)
+        if len(kept) == len(items):
+            continue
+        if kept:
+            sql = sql[:start] + ','.join(kept).strip() + sql[end:]
+        elif match.group() == 'SELECT ':
+            return None
+        else:
+            sql = sql[:match.start()].rstrip() + sql[end:]
+    return sql
+
+
+################# test case #################
+class Case:
+    """A finding as a replayable test case: schema, rows, derived table and the differing select pair."""
+
+    def __init__(self, create_sql: str, insert_prefix: str, rows: list, derived_sqls: list, session_sqls: list,
+                 base_select: str, equal_select: str, expr: str, column: str):
+        self.create_sql = create_sql
+        self.insert_prefix = insert_prefix
+        self.rows = rows
+        self.derived_sqls = derived_sqls
+        self.session_sqls = session_sqls
+        self.base_select = base_select
+        self.equal_select = equal_select
+        self.expr = expr
+        self.column = column
+
+    @classmethod
+    def from_finding(cls, finding: dict):
+        rows, derived_sqls, insert_prefix = [], [finding['derived_sql']], f'INSERT INTO {ORI_TABLE} VALUES '
+        for sql in finding['insert_sqls']:
+            pos = sql.find(' VALUES ')
+            if sql.startswith(f'INSERT INTO {ORI_TABLE} ') and pos >= 0:
+                insert_prefix = sql[:pos + len(' VALUES ')]
+                rows.extend(row.strip() for row in split_top_level(sql[pos + len(' VALUES '):], [',']))
+            else:
+                derived_sqls.append(sql)
+        # SET statements are stored as pairs of the same statement, the select pairs differ in their tables
+        select_pairs = [pair for pair in finding['pairs'] if pair[0] != pair[1]]
+        if not select_pairs:
+            raise ValueError(f"Finding {finding['name']} has no select pair")
+        session_sqls = [s1 for s1, s2 in finding['pairs'] if s1 == s2]
+        base_select, equal_select = select_pairs[-1]
+        # the test expression of the pair is the derived column that its equivalent select reads
+        exprs = {}
+        for sql in derived_sqls:
+            exprs.update(derived_exprs(sql))
+        expr, column = None, 'c0'
+        for candidate, candidate_expr in exprs.items():
+            if re.search(rf'\b{candidate}\b', equal_select) and candidate_expr in base_select:
+                expr, column = candidate_expr, candidate
+                break
+        return cls(finding['create_sql'], insert_prefix, rows, derived_sqls, session_sqls,
+                   base_select, equal_select, expr, column)
+
+    def replace(self, **changes):
+        case = copy.copy(self)
+        case.__dict__.update(changes)
+        return case
+
+    def data_key(self):
+        return self.create_sql, self.insert_prefix, tuple(self.rows), tuple(self.derived_sqls), tuple(self.session_sqls)
+
+    def to_equal(self, sql: str):
+        """Renders the equivalent side of a part of the base select from the query fragment it was rendered from."""
+        slots = {ORI_TABLE: TABLE, self.expr: EXPR} if self.expr else {ORI_TABLE: TABLE}
+        base, equal = {TABLE: ORI_TABLE, EXPR: self.expr}, {TABLE: DERIVED_TABLE, EXPR: self.column}
+        return parse(sql, slots).render(base, equal)[1]
+
+    def size(self):
+        return sum(len(sql) for sql in self.statements())
+
+    def statements(self):
+        return [self.create_sql] + [self.insert_prefix + row for row in self.rows] + self.derived_sqls + \
+            self.session_sqls + [self.base_select, self.equal_select]
+
+
+def expr_candidates(case: Case):
+    """Replaces a condition or a parenthesized expression of the pair by one of its operands, on both sides."""
+    base, equal = case.base_select, case.equal_select
+    for start, end in find_conditions(base) + find_groups(base):
+        content = base[start:end]
+        operands = [operand.strip() for operand in split_top_level(content, OPERATORS)]
+        if len(operands) < 2 or base.count(content) != 1:
+            continue
+        equal_content = case.to_equal(content)
+        if equal.count(equal_content) != 1:
+            continue
+        for operand in operands:
+            yield case.replace(base_select=base[:start] + operand + base[end:],
+                               equal_select=equal.replace(equal_content, case.to_equal(operand)))
+
+
+def column_candidates(case: Case):
+    """Drops a column that the test expression does not use from the tables, the rows and the queries."""
+    groups = find_groups(case.create_sql)
+    if not groups:
+        return
+    column_defs = split_top_level(case.create_sql[groups[0][0]:groups[0][1]], [','])
+    columns = [column_def.strip().split(' ')[0] for column_def in column_defs]
+    prefix_groups = find_groups(case.insert_prefix)
+    insert_columns = split_top_level(case.insert_prefix[prefix_groups[0][0]:prefix_groups[0][1]], [',']) \
+        if prefix_groups else columns
+    insert_columns = [name.strip() for name in insert_columns]
+    for col in columns:
+        if (case.expr and re.search(rf'\b{col}\b', case.expr)) or col not in insert_columns:
+            continue
+        index = insert_columns.index(col)
+        rows = []
+        for row in case.rows:
+            values = split_top_level(row.strip()[1:-1], [','])
+            if len(values) != len(insert_columns):
+                break
+            rows.append('(' + ','.join(values[:index] + values[index + 1:]).strip() + ')')
+        else:
+            create_sql = drop_column_def(case.create_sql, col)
+            insert_prefix = drop_column_def(case.insert_prefix.replace('INSERT INTO', 'CREATE TABLE', 1), col)
+            derived_sqls = [drop_column_refs(drop_column_def(sql, col) or '', col) for sql in case.derived_sqls]
+            base_select = drop_column_refs(case.base_select, col)
+            equal_select = drop_column_refs(case.equal_select, col)
+            if None in [create_sql, insert_prefix, base_select, equal_select] or None in derived_sqls:
+                continue
+            yield case.replace(create_sql=create_sql,
+                               insert_prefix=insert_prefix.replace('CREATE TABLE', 'INSERT INTO', 1),
+                               rows=rows, derived_sqls=derived_sqls,
+                               base_select=base_select, equal_select=equal_select)
+
+
+def derived_column_candidates(case: Case):
+    """Drops a derived column of another test expression from the derived table."""
+    columns = {}
+    for sql in case.derived_sqls:
+        columns.update(derived_exprs(sql))
+    for col in columns:
+        if col == case.column:
+            continue
+        derived_sqls = [drop_column_refs(drop_column_def(sql, col) or '', col) for sql in case.derived_sqls]
+        if None not in derived_sqls and derived_sqls != case.derived_sqls:
+            yield case.replace(derived_sqls=derived_sqls)
+
+
+################# reduction #################
+class Sandbox:
+    """A cloned schema holding the data of the last test case it ran, so queries on the same data skip the setup."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.data_key = None
+
+    def run(self, case: Case):
+        conn = self.conn
+        if self.data_key != case.data_key():
+            self.data_key = None
+            if not conn.reset() or conn.execute(case.create_sql).is_error():
+                return None
+            batch_size = max(1, config.insert_batch_size)
+            for i in range(0, len(case.rows), batch_size):
+                batch = case.rows[i:i + batch_size]
+                if conn.execute(case.insert_prefix + ', '.join(batch)).is_error() and len(batch) > 1:
+                    for row in batch:
+                        conn.execute(case.insert_prefix + row)
+            for sql in case.derived_sqls + case.session_sqls:
+                conn.execute(sql)
+            self.data_key = case.data_key()
+        return conn.execute(case.base_select), conn.execute(case.equal_select)
+
+
+class Reducer:
+    """
+    Shrinks a finding while it still reproduces: drops inserted rows (delta debugging), replaces the
+    WHERE/HAVING expressions by their operands, and drops the columns the test expression does not use.
+    Candidates are checked in parallel, each on its own cloned schema.
+    """
+
+    def __init__(self, target: str, jobs: int):
+        self.jobs = jobs
+        self.pool = get_pool(target, f'reduce{os.getpid()}', jobs)
+        self.sandboxes = queue.Queue()
+        for _ in range(jobs):
+            self.sandboxes.put(Sandbox(self.pool.acquire()))
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+        self.shape = None
+        # candidates checked for the finding being reduced
+        self.checks = 0
+
+    def close(self):
+        self.executor.shutdown()
+        while not self.sandboxes.empty():
+            self.pool.release(self.sandboxes.get().conn)
+        self.pool.close()
+
+    def run_case(self, case: Case):
+        sandbox = self.sandboxes.get()
+        try:
+            return sandbox.run(case)
+        finally:
+            self.sandboxes.put(sandbox)
+
+    def reproduces(self, case: Case):
+        res = self.run_case(case)
+        if res is None:
+            return False
+        res1, res2 = res
+        if res1.blacklisted or res2.blacklisted or res1 == res2:
+            return False
+        # a reduction must not turn the discrepancy into a different one, e.g. an error on one side only
+        return (res1.is_error(), res2.is_error()) == self.shape
+
+    def first(self, candidates):
+        """Returns the first candidate, in order, that still reproduces the discrepancy."""
+        candidates = list(candidates)
+        for i in range(0, len(candidates), self.jobs):
+            chunk = candidates[i:i + self.jobs]
+            self.checks += len(chunk)
+            for candidate, reproduced in zip(chunk, self.executor.map(self.reproduces, chunk)):
+                if reproduced:
+                    return candidate
+        return None
+
+    def greedy(self, case: Case, generate):
+        while True:
+            found = self.first(generate(case))
+            if found is None:
+                return case
+            case = found
+
+    def reduce_rows(self, case: Case):
+        n = 2
+        while len(case.rows) >= 2:
+            chunk = -(-len(case.rows) // n)
+            found = self.first(case.replace(rows=case.rows[:i] + case.rows[i + chunk:])
+                               for i in range(0, len(case.rows), chunk))
+            if found is not None:
+                case = found
+                n = max(n - 1, 2)
+            elif n >= len(case.rows):
+                break
+            else:
+                n = min(len(case.rows), n * 2)
+        return case
+
+    def reduce(self, case: Case):
+        res = self.run_case(case)
+        if res is None or res[0] == res[1]:
+            raise ValueError('The discrepancy does not reproduce')
+        self.shape = (res[0].is_error(), res[1].is_error())
+        self.checks = 0
+
+        while True:
+            size = case.size()
+            case = self.greedy(case, expr_candidates)
+            case = self.reduce_rows(case)
+            case = self.greedy(case, derived_column_candidates)
+            case = self.greedy(case, column_candidates)
+            case = self.greedy(case, lambda c: (c.replace(session_sqls=c.session_sqls[:i] + c.session_sqls[i + 1:])
+                                                for i in range(len(c.session_sqls))))
+            if case.size() >= size:
+                return case
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reduce findings from a findings store by replaying them against the target')
+    parser.add_argument('target', type=str, help='The target database name, as in config/conn.ini')
+    parser.add_argument('store', type=str, help='Path of the findings store, e.g. ../res/mysql/findings.db')
+    parser.add_argument('id', type=int, nargs='+', help='Ids of the findings to reduce')
+    parser.add_argument('--jobs', type=int, default=4, help='Number of candidates checked in parallel')
+    parser.add_argument('--out', type=str, default=None, help='Output directory, ../res/{target}/reduced by default')
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level='ERROR')
+    out_path = args.out or f'../res/{args.target}/reduced'
+    db = sqlite3.connect(args.store)
+    findings = list(load_findings(db, args.id))
+    db.close()
+
+    reducer = Reducer(args.target, max(1, args.jobs))
+    try:
+        for finding in findings:
+            start = time.time()
+            try:
+                case = Case.from_finding(finding)
+                size = case.size()
+                reduced = reducer.reduce(case)
+            except ValueError as e:
+                print(f"{finding['id']} {finding['name']}: {e}")
+                continue
+            res1, res2 = reducer.run_case(reduced)
+            full_path = os.path.join(out_path, f"{finding['name']}.sql")
+            sql_to_file(res1.get_res() + res2.get_res() + reduced.statements(), full_path)
+            print(f"{finding['id']} {finding['name']}: {size} -> {reduced.size()} chars, {len(reduced.rows)} rows, "
+                  f"{reducer.checks} checks in {time.time() - start:.1f}s, written to {full_path}")
+    except Exception as e:
+        logger.error(f"Reducer error: {e}")
+        logger.error(traceback.format_exc())
+    finally:
+        reducer.close()
+
+
+if __name__ == '__main__':
+    main()
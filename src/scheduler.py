@@ -0,0 +1,120 @@
+import random
+
+
+class Bandit:
+    """
+    Thompson sampling over a fixed set of arms with rewards in [0, 1]. Past outcomes lose weight by decay
+    at every update, so the estimates follow a DBMS whose productive areas shift, and each pick is uniform
+    with probability floor, so no arm is ever starved.
+    """
+
+    def __init__(self, arms: list, decay: float, floor: float):
+        self.arms = list(dict.fromkeys(arms))
+        self.decay = decay
+        self.floor = floor
+        # decayed sums of rewards and of outcomes, starting from a uniform Beta(1, 1) prior
+        self.rewards = {arm: 0.0 for arm in self.arms}
+        self.counts = {arm: 0.0 for arm in self.arms}
+
+    def sample(self, k: int = 1):
+        """Picks k distinct arms."""
+        k = min(k, len(self.arms))
+        if self.floor >= 1:
+            return random.sample(self.arms, k)
+        scores = {arm: random.betavariate(1 + self.rewards[arm], 1 + self.counts[arm] - self.rewards[arm])
+                  for arm in self.arms}
+        remaining = sorted(self.arms, key=scores.get, reverse=True)
+        picked = []
+        for _ in range(k):
+            i = random.randrange(len(remaining)) if random.random() < self.floor else 0
+            picked.append(remaining.pop(i))
+        return picked
+
+    def update(self, outcomes: list):
+        """Records the (arm, reward) outcomes of one case."""
+        if self.decay < 1:
+            for arm in self.arms:
+                self.rewards[arm] *= self.decay
+                self.counts[arm] *= self.decay
+        for arm, reward in outcomes:
+            if arm in self.counts:
+                self.rewards[arm] += reward
+                self.counts[arm] += 1
+
+    def top(self, n: int):
+        """The n arms with the highest estimated reward among those tried, with their estimates."""
+        means = {arm: (1 + self.rewards[arm]) / (2 + self.counts[arm]) for arm in self.arms if self.counts[arm] >= 1}
+        return sorted(means.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    def state(self):
+        return {str(arm): [self.rewards[arm], self.counts[arm]] for arm in self.arms}
+
+    def load(self, state: dict):
+        """Restores the estimates of a checkpoint, arms no longer in the seed files are dropped."""
+        for arm in self.arms:
+            if str(arm) in state:
+                self.rewards[arm], self.counts[arm] = state[str(arm)]
+
+
+class Scheduler:
+    """
+    Picks the op type, the ops and the column types of the cases. Every test is scored by what it yielded:
+    1 for a discrepancy of a signature not seen before, pass_reward for a repeated one, a share of pass_reward
+    by the non-blacklisted pairs it compared otherwise, and 0 if it stopped early or was invalid. The scores
+    go to the ops of the case, the best one to its op type and its seed column types.
+    """
+
+    def __init__(self, op_lists: dict, type_list: list, decay: float, floor: float, pass_reward: float):
+        self.op_types = Bandit(list(op_lists), decay, floor)
+        self.ops = {op_type: Bandit(op_list, decay, floor) for op_type, op_list in op_lists.items()}
+        self.types = Bandit(type_list, decay, floor)
+        self.pass_reward = pass_reward
+        self.signatures = set()
+
+    def sample_op_type(self):
+        return self.op_types.sample()[0]
+
+    def sample_ops(self, op_type, k: int):
+        return self.ops[op_type].sample(k)
+
+    def sample_type(self):
+        return self.types.sample()[0]
+
+    def test_reward(self, signature: str, pairs: int, select_cnt: int):
+        if signature is not None:
+            if signature in self.signatures:
+                return self.pass_reward
+            self.signatures.add(signature)
+            return 1.0
+        return self.pass_reward * min(pairs, select_cnt) / max(select_cnt, 1)
+
+    @staticmethod
+    def outcome(case: dict):
+        """Summarizes a finished case for update, small enough to be sent back to a producer process."""
+        rewards = {test['op']: test.get('reward', 0.0) for test in case['tests']}
+        best = max(rewards.values(), default=0.0)
+        return case['op_type'], [(op, rewards.get(op, 0.0)) for op in case['ops']], case['seed_types'], best
+
+    def update(self, outcome: tuple):
+        op_type, op_rewards, seed_types, best = outcome
+        self.op_types.update([(op_type, best)])
+        self.ops[op_type].update(op_rewards)
+        self.types.update([(seed_type, best) for seed_type in dict.fromkeys(seed_types)])
+
+    def state(self):
+        """The estimates and the signatures seen, as saved in the checkpoints of a campaign."""
+        return {'op_types': self.op_types.state(), 'ops': {str(op_type): bandit.state() for op_type, bandit in self.ops.items()},
+                'types': self.types.state(), 'signatures': sorted(self.signatures)}
+
+    def load(self, state: dict):
+        self.op_types.load(state['op_types'])
+        for op_type, bandit in self.ops.items():
+            bandit.load(state['ops'].get(str(op_type), {}))
+        self.types.load(state['types'])
+        self.signatures.update(state['signatures'])
+
+    def summary(self, n: int = 5):
+        ops = [(op, mean) for bandit in self.ops.values() for op, mean in bandit.top(n)]
+        ops = sorted(ops, key=lambda item: item[1], reverse=True)[:n]
+        return (f"top ops: {', '.join(f'{op} ({mean:.3f})' for op, mean in ops)}; "
+                f"top types: {', '.join(f'{t} ({mean:.3f})' for t, mean in self.types.top(n))}")
@@ -2,6 +2,27 @@ import uuid
 import random
 import string
 import datetime
+from sql.query import Node
+from sql.type_descriptor import TypeDescriptor
+
+try:
+    import numpy as np
+except ImportError:
+    # without numpy, generate_random_values generates the values one by one
+    np = None
+
+
+ALPHANUMERIC = string.ascii_letters + string.digits
+# inclusive value ranges of the integer types, as drawn by generate_random_value
+INT_RANGES = {}
+for names, bounds in [(["TINYINT", "BOOL", "BOOLEAN", "INT8", "UINT8"], (-128, 127)),
+                      (["SMALLINT", "INT16", "UINT16"], (-32768, 32767)),
+                      (["MEDIUMINT", "INT32", "UINT32"], (-8388608, 8388607)),
+                      (["INT", "INTEGER", "UINTEGER"], (-2147483648, 2147483647)),
+                      (["BIGINT", "HUGEINT", "UBIGINT", "INT64", "UINT64"], (-9223372036854775808, 9223372036854775807)),
+                      (["BIT"], (0, 1))]:
+    for name in names:
+        INT_RANGES.setdefault(name, bounds)
 
 
 class Constant:
@@ -23,8 +44,11 @@ class Constant:
 class ExprGenerator:
     def __init__(self, target: str):
         self.database = target
+        # type string -> TypeDescriptor
+        self.descriptors = {}
 
-    def generate_expr_on_column(self, table: str, column_names: list, column_types: list, depth: int) -> str:       
+    def generate_expr_on_column(self, table, column_names: list, column_types: list, depth: int) -> Node:
+        """Generates a condition tree, table and the column names are text or query fragments such as slots."""
         type = [] 
         if column_names:
             if depth == 1:
@@ -37,21 +61,23 @@ class ExprGenerator:
         op = random.choice(type)
         if op == 'CONSTANT':
             if random.randint(0, 5) < 3:
-                return str(self.generate_single_constant(random.choice(column_types))) if column_types else self.generate_single_constant()
+                return Node(self.generate_single_constant(random.choice(column_types)) if column_types else self.generate_single_constant())
             elif random.randint(0, 1) == 0:
-                return str(self.generate_expr_constant(random.choice(column_types))) if column_types else self.generate_expr_constant()
+                return Node(self.generate_expr_constant(random.choice(column_types)) if column_types else self.generate_expr_constant())
             else:
-                return 'NULL'
+                return Node('NULL')
         elif op == 'COLUMN':
-            return random.choice(column_names)
+            return Node(random.choice(column_names))
         elif op == 'CASE':
-            return f'(CASE WHEN {self.generate_expr_on_column(table, column_names, column_types, depth - 1)} THEN ({self.generate_expr_constant(random.choice(column_types))}) ELSE ({self.generate_expr_constant(random.choice(column_types))}) END)'
+            return Node('(CASE WHEN ', self.generate_expr_on_column(table, column_names, column_types, depth - 1), f' THEN ({self.generate_expr_constant(random.choice(column_types))}) ELSE ({self.generate_expr_constant(random.choice(column_types))}) END)')
         elif op == 'SUBQUERY':
             aggs = ['IN', 'NOT IN']
             agg = random.choice(aggs)
-            return f'{self.generate_expr_on_column(table, column_names, column_types, depth - 1)} {agg} (SELECT {random.choice(column_names)} FROM {table} WHERE {self.generate_expr_on_column(table, column_names, column_types, depth - 1)})'
+            left = self.generate_expr_on_column(table, column_names, column_types, depth - 1)
+            return Node(left, f' {agg} (SELECT ', random.choice(column_names), ' FROM ', table, ' WHERE ', self.generate_expr_on_column(table, column_names, column_types, depth - 1), ')')
         else:
-            return f'({self.generate_expr_on_column(table, column_names, column_types, depth - 1)} {op} {self.generate_expr_on_column(table, column_names, column_types, depth - 1)})'
+            left = self.generate_expr_on_column(table, column_names, column_types, depth - 1)
+            return Node('(', left, f' {op} ', self.generate_expr_on_column(table, column_names, column_types, depth - 1), ')')
 
 
     def generate_expr_constant(self, ori_typ: str = None, dest_typ: str = None) -> Constant:
@@ -74,92 +100,170 @@ class ExprGenerator:
     def generate_random_value(self, data_type, depth=0, max_depth=3):
         if depth >= max_depth:
             return '0'  
-        
-        data_type = data_type.upper() if data_type else 'INT'
-
-        if data_type.startswith('ARRAY'):
-            return self._generate_array_value(data_type, depth, max_depth)
-        elif data_type.startswith('TUPLE'):
-            return self._generate_tuple_value(data_type, depth, max_depth)
-        elif data_type.startswith('MAP'):
-            return self._generate_map_value(data_type, depth, max_depth)
-        elif data_type == "JSON":
-            return self._generate_json_value(depth, max_depth)
-        elif data_type in ["TINYINT", "BOOL", "BOOLEAN", "INT8", "UINT8"]:
-            return random.randint(-128, 127)
-        elif data_type in ["SMALLINT", "INT16", "UINT16"]:
-            return random.randint(-32768, 32767)
-        elif data_type in ["MEDIUMINT", "INT32", "UINT32"]:
-            return random.randint(-8388608, 8388607)
-        elif data_type in ["INT", "INTEGER", "UINTEGER", "INT32", "UINT32"]:
-            return random.randint(-2147483648, 2147483647)
-        elif data_type in ["BIGINT", "HUGEINT", "UBIGINT", "INT64", "UINT64"]:
-            return random.randint(-9223372036854775808, 9223372036854775807)
-        elif data_type.startswith("DECIMAL") or "DEC" in data_type:
-            return round(random.uniform(-1e10, 1e10), 6)
-        elif data_type in ["FLOAT", "REAL", "FLOAT64"]:
-            return self._generate_float_value()
-        elif data_type == "DOUBLE":
-            return self._generate_double_value()
-        elif data_type == "BIT":
-            return random.randint(0, 1)
-        elif data_type.startswith("VARBINARY") or data_type.startswith("BINARY"):
-            return self._generate_binary_value(data_type)
-        elif data_type in ["TINYBLOB", "BLOB", "MEDIUMBLOB", "LONGBLOB"]:
-            return self._generate_blob_value()
-        elif data_type in ["TINYTEXT", "TEXT", "MEDIUMTEXT", "LONGTEXT", "CLOB", "STRING"]:
-            return self._generate_text_value()
-        elif data_type.startswith("VARCHAR") or data_type.startswith("CHAR") or data_type.startswith("FIXEDSTRING"):
-            return self._generate_string_value(data_type)
-        elif data_type.startswith("ENUM"):
-            return self._generate_enum_value(data_type)
-        elif data_type in ["INET4", "IPV4"]:
-            return self._generate_ipv4_value()
-        elif data_type in ["INET6", "IPV6"]:
-            return self._generate_ipv6_value()
-        elif data_type == "UUID":
-            return f"'{str(uuid.uuid4())}'"
-        elif data_type.startswith("DATETIME"):
-            return self._generate_datetime_value()
-        elif data_type.startswith("TIMESTAMP"):
-            return self._generate_timestamp_value()
-        elif data_type.startswith("DATE"):
-            return self._generate_date_value()
-        elif data_type.startswith("TIME"):
-            return self._generate_time_value()
-        elif data_type == "YEAR":
-            return str(random.randint(1900, 2100))
-        elif data_type.startswith("INTERVAL DAY TO SECOND"):
-            return self._generate_interval_value()
-        elif data_type == "GEOMETRY":
-            data_type = random.choice(["POINT", "LINESTRING", "POLYGON", "MULTIPOINT", "MULTILINESTRING", "MULTIPOLYGON", "GEOMETRYCOLLECTION"])
-            return self._generate_spatial_value(data_type)
-        elif data_type in ["POINT", "LINESTRING", "POLYGON", "MULTIPOINT", "MULTILINESTRING", "MULTIPOLYGON", "GEOMCOLLECTION", "GEOMETRYCOLLECTION", "RING"]:
-            return self._generate_spatial_value(data_type)
-        elif data_type.startswith("VECTOR"):
-            return self._generate_vector_value(data_type)
+        return self.describe(data_type).generate(depth, max_depth)
+
+    def describe(self, data_type) -> TypeDescriptor:
+        """The descriptor of a type string, parsed on first use and cached by the string."""
+        data_type = data_type or 'INT'
+        descriptor = self.descriptors.get(data_type)
+        if descriptor is None:
+            descriptor = self.descriptors[data_type] = self._parse_type(data_type)
+        return descriptor
+
+    def _parse_type(self, data_type: str) -> TypeDescriptor:
+        """Parses a type string and binds the value generator of its type, raises ValueError for unsupported types."""
+        d = TypeDescriptor(data_type, self.database)
+        name = d.name
+        if name.startswith('ARRAY'):
+            if len(d.args) != 1:
+                raise ValueError(f"Unsupported data type in {self.database}: {data_type.upper()}")
+            d.elements = [self.describe(d.args[0])]
+            d.generate = lambda depth, max_depth: self._generate_array_value(d.elements[0], depth, max_depth)
+        elif name.startswith('TUPLE'):
+            d.elements = [self.describe(arg) for arg in d.args]
+            d.generate = lambda depth, max_depth: self._generate_tuple_value(d.elements, depth, max_depth)
+        elif name.startswith('MAP'):
+            if len(d.args) == 2:
+                d.elements = [self.describe(arg) for arg in d.args]
+            d.generate = lambda depth, max_depth: self._generate_map_value(d.elements, depth, max_depth)
+        elif name == "JSON":
+            d.generate = self._generate_json_value
+        elif name in INT_RANGES:
+            low, high = INT_RANGES[name]
+            d.batch_kind = 'int'
+            d.generate = lambda depth, max_depth: random.randint(low, high)
+        elif name.startswith("DECIMAL") or "DEC" in name:
+            d.batch_kind = 'decimal'
+            d.generate = lambda depth, max_depth: round(random.uniform(-1e10, 1e10), 6)
+        elif name in ["FLOAT", "REAL", "FLOAT64"]:
+            d.batch_kind = 'float'
+            d.generate = lambda depth, max_depth: self._generate_float_value()
+        elif name == "DOUBLE":
+            d.batch_kind = 'double'
+            d.generate = lambda depth, max_depth: self._generate_double_value()
+        elif name.startswith("VARBINARY") or name.startswith("BINARY"):
+            d.batch_kind = 'binary'
+            d.generate = lambda depth, max_depth: self._generate_binary_value(d.length)
+        elif name in ["TINYBLOB", "BLOB", "MEDIUMBLOB", "LONGBLOB", "TINYTEXT", "TEXT", "MEDIUMTEXT", "LONGTEXT", "CLOB", "STRING"]:
+            d.batch_kind = 'text'
+            d.generate = lambda depth, max_depth: self._generate_text_value()
+        elif name.startswith("VARCHAR") or name.startswith("CHAR") or name.startswith("FIXEDSTRING"):
+            d.batch_kind = 'string'
+            d.generate = lambda depth, max_depth: self._generate_string_value(d.length)
+        elif name.startswith("ENUM"):
+            # the catalog names enum columns without their values, any string stands in for them
+            if d.values:
+                d.generate = lambda depth, max_depth: self._generate_enum_value(d.values)
+            else:
+                d.generate = lambda depth, max_depth: self._generate_string_value(d.length)
+        elif name in ["INET4", "IPV4"]:
+            d.generate = lambda depth, max_depth: self._generate_ipv4_value()
+        elif name in ["INET6", "IPV6"]:
+            d.generate = lambda depth, max_depth: self._generate_ipv6_value()
+        elif name == "UUID":
+            d.generate = lambda depth, max_depth: f"'{str(uuid.UUID(int=random.getrandbits(128), version=4))}'"
+        elif name.startswith("DATETIME"):
+            d.batch_kind = 'datetime'
+            d.generate = lambda depth, max_depth: self._generate_datetime_value()
+        elif name.startswith("TIMESTAMP"):
+            d.batch_kind = 'timestamp'
+            d.generate = lambda depth, max_depth: self._generate_timestamp_value()
+        elif name.startswith("DATE"):
+            d.batch_kind = 'date'
+            d.generate = lambda depth, max_depth: self._generate_date_value()
+        elif name.startswith("TIME"):
+            d.batch_kind = 'time'
+            d.generate = lambda depth, max_depth: self._generate_time_value()
+        elif name == "YEAR":
+            d.batch_kind = 'year'
+            d.generate = lambda depth, max_depth: str(random.randint(1900, 2100))
+        elif name.startswith("INTERVAL DAY TO SECOND"):
+            d.generate = lambda depth, max_depth: self._generate_interval_value()
+        elif name == "GEOMETRY":
+            d.generate = lambda depth, max_depth: self._generate_spatial_value(random.choice(["POINT", "LINESTRING", "POLYGON", "MULTIPOINT", "MULTILINESTRING", "MULTIPOLYGON", "GEOMETRYCOLLECTION"]))
+        elif name in ["POINT", "LINESTRING", "POLYGON", "MULTIPOINT", "MULTILINESTRING", "MULTIPOLYGON", "GEOMCOLLECTION", "GEOMETRYCOLLECTION", "RING"]:
+            d.generate = lambda depth, max_depth: self._generate_spatial_value(name)
+        elif name.startswith("VECTOR"):
+            d.generate = lambda depth, max_depth: self._generate_vector_value(d.length)
         else:
-            raise ValueError(f"Unsupported data type in {self.database}: {data_type}")
-
-    def _generate_array_value(self, data_type, depth, max_depth):
-        inner_type = data_type[data_type.find('(')+1:data_type.find(')')]
+            raise ValueError(f"Unsupported data type in {self.database}: {data_type.upper()}")
+        return d
+
+    def generate_random_values(self, data_type, n: int) -> list:
+        """
+        Generates n values of data_type at once, like n calls of generate_random_value. Numeric, temporal,
+        string and binary types are drawn as arrays when numpy is installed, any other type value by value.
+        """
+        descriptor = self.describe(data_type)
+        kind = descriptor.batch_kind
+        if np is None or kind is None or n <= 0:
+            return [self.generate_random_value(data_type) for _ in range(n)]
+        # numpy draws from a generator seeded by the random module, so a campaign seed still fixes the values
+        rng = np.random.default_rng(random.getrandbits(64))
+        if kind == 'int':
+            low, high = INT_RANGES[descriptor.name]
+            return rng.integers(low, high, size=n, endpoint=True, dtype=np.int64).tolist()
+        elif kind == 'decimal':
+            return np.round(rng.uniform(-1e10, 1e10, n), 6).tolist()
+        elif kind == 'float':
+            return self._uniform_values(rng, 1e38, n)
+        elif kind == 'double':
+            return self._uniform_values(rng, 1e308, n)
+        elif kind == 'binary':
+            return ['0x' + value for value in self._string_values(rng, '0123456789ABCDEF', descriptor.length, n)]
+        elif kind == 'text':
+            return [f"'{value}'" for value in self._string_values(rng, ALPHANUMERIC, 50, n, rng.integers(1, 50, n, endpoint=True))]
+        elif kind == 'string':
+            return [f"'{value}'" for value in self._string_values(rng, ALPHANUMERIC, descriptor.length, n)]
+        elif kind == 'year':
+            return [str(year) for year in rng.integers(1900, 2100, n, endpoint=True).tolist()]
+        elif kind == 'time':
+            hours, minutes, seconds = (rng.integers(0, high, n, endpoint=True).tolist() for high in (23, 59, 59))
+            return [f"'{h:02d}:{m:02d}:{s:02d}'" for h, m, s in zip(hours, minutes, seconds)]
+        first_year, last_year = (1970, 2035) if kind == 'timestamp' else (1900, 2100)
+        years = rng.integers(first_year, last_year, n, endpoint=True).tolist()
+        months = rng.integers(1, 12, n, endpoint=True).tolist()
+        days = rng.integers(1, 28, n, endpoint=True).tolist()
+        if kind == 'date':
+            return [f"'{y:04d}-{mo:02d}-{d:02d}'" for y, mo, d in zip(years, months, days)]
+        hours, minutes, seconds = (rng.integers(0, high, n, endpoint=True).tolist() for high in (23, 59, 59))
+        return [f"'{y:04d}-{mo:02d}-{d:02d} {h:02d}:{m:02d}:{s:02d}'"
+                for y, mo, d, h, m, s in zip(years, months, days, hours, minutes, seconds)]
+
+    @staticmethod
+    def _uniform_values(rng, bound: float, n: int):
+        # like random.uniform, a range too wide for a float gives inf, which is drawn again from +-1e30
+        with np.errstate(over='ignore', invalid='ignore'):
+            values = np.round(-bound + (2 * bound) * rng.random(n), 6)
+        infinite = ~np.isfinite(values)
+        values[infinite] = np.round(rng.uniform(-1e30, 1e30, int(infinite.sum())), 6)
+        return values.tolist()
+
+    @staticmethod
+    def _string_values(rng, alphabet: str, length: int, n: int, lengths=None):
+        """n random strings over alphabet, all of the given length or of the given lengths (at most length)."""
+        codes = np.frombuffer(alphabet.encode('ascii'), dtype=np.uint8)
+        text = codes[rng.integers(0, len(codes), size=(n, length))].tobytes().decode('ascii')
+        if lengths is None:
+            return [text[i * length:(i + 1) * length] for i in range(n)]
+        return [text[i * length:i * length + size] for i, size in enumerate(lengths.tolist())]
+
+    def _generate_array_value(self, element: TypeDescriptor, depth, max_depth):
         size = random.randint(1, 2)  
-        values = [str(self.generate_random_value(inner_type, depth + 1, max_depth)) for _ in range(size)]
+        values = [str(self.generate_random_value(element.type, depth + 1, max_depth)) for _ in range(size)]
         return f"[{', '.join(values)}]"
 
-    def _generate_tuple_value(self, data_type, depth, max_depth):
-        if '(' in data_type and ')' in data_type:
-            inner_types = data_type[data_type.find('(')+1:data_type.find(')')].split(',')
-            values = [str(self.generate_random_value(typ.strip(), depth + 1, max_depth)) for typ in inner_types]
+    def _generate_tuple_value(self, elements: list, depth, max_depth):
+        if elements:
+            values = [str(self.generate_random_value(element.type, depth + 1, max_depth)) for element in elements]
             return f"({', '.join(values)})"
         return "(0, 0)"
 
-    def _generate_map_value(self, data_type, depth, max_depth):
-        if '(' in data_type and ')' in data_type:
-            type_part = data_type[data_type.find('(')+1:data_type.find(')')]
-            key_type, value_type = [t.strip() for t in type_part.split(',', 1)]
+    def _generate_map_value(self, elements: list, depth, max_depth):
+        if elements:
+            key_type, value_type = elements
             size = random.randint(1, 2)  
-            pairs = [f"{self.generate_random_value(key_type, depth + 1, max_depth)}: {self.generate_random_value(value_type, depth + 1, max_depth)}" for _ in range(size)]
+            pairs = [f"{self.generate_random_value(key_type.type, depth + 1, max_depth)}: {self.generate_random_value(value_type.type, depth + 1, max_depth)}" for _ in range(size)]
             return f"{{{', '.join(pairs)}}}"
         return "{}"
 
@@ -191,32 +295,18 @@ class ExprGenerator:
             value = round(random.uniform(-1e30, 1e30), 6)
         return value
 
-    def _generate_binary_value(self, data_type):
-        if '(' in data_type and ')' in data_type:
-            length = int(data_type[data_type.find('(')+1:data_type.find(')')])
-        else:
-            length = 10
+    def _generate_binary_value(self, length):
         return "0x" + ''.join(random.choices('0123456789ABCDEF', k=length))
 
-    def _generate_blob_value(self):
-        length = random.randint(1, 50)
-        return "'" + ''.join(random.choices(string.ascii_letters + string.digits, k=length)) + "'"
-
     def _generate_text_value(self):
         length = random.randint(1, 50)
         return "'" + ''.join(random.choices(string.ascii_letters + string.digits, k=length)) + "'"
 
-    def _generate_string_value(self, data_type):
-        if '(' in data_type and ')' in data_type:
-            length = int(data_type[data_type.find('(')+1:data_type.find(')')])
-        else:
-            length = 10
+    def _generate_string_value(self, length):
         return "'" + ''.join(random.choices(string.ascii_letters + string.digits, k=length)) + "'"
 
-    def _generate_enum_value(self, data_type):
-        choices = data_type[data_type.find('(')+1:data_type.find(')')].split(',')
-        choices = random.choice([choice.strip().strip("'") for choice in choices])
-        return f"'{random.choice([choice for choice in choices])}'"
+    def _generate_enum_value(self, values):
+        return f"'{random.choice(values)}'"
 
     def _generate_ipv4_value(self):
         return "'" + '.'.join(str(random.randint(0, 255)) for _ in range(4)) + "'"
@@ -397,16 +487,12 @@ class ExprGenerator:
         else:
             raise ValueError(f"Unsupported spatial data type: {data_type}")
         
-    def _generate_vector_value(self, data_type):
+    def _generate_vector_value(self, length):
         if self.database in ['mariadb']:
-            return self._generate_mariadb_vector_value(data_type)
+            return self._generate_mariadb_vector_value(length)
         else:
             raise ValueError(f"Unsupported vector data type")
         
-    def _generate_mariadb_vector_value(self, data_type):
-        if '(' in data_type and ')' in data_type:
-            length = int(data_type[data_type.find('(')+1:data_type.find(')')])
-        else:
-            length = 10
+    def _generate_mariadb_vector_value(self, length):
         values = [random.uniform(-1000000, 1000000) for _ in range(length)]
         return f"VEC_FromText('[{', '.join(str(value) for value in values)}]')"
\ No newline at end of file
@@ -0,0 +1,166 @@
+class Slot:
+    """A part of a query that is rendered differently in the base and in the equivalent query."""
+    __slots__ = ('name',)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return '{' + self.name + '}'
+
+    # slots are compared by name, so that trees sent to another process still find their slots in the mappings
+    def __eq__(self, other):
+        return isinstance(other, Slot) and self.name == other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+
+# the table the query reads: the original table in the base query, the derived table in the equivalent one
+TABLE = Slot('table')
+# the tested expression in the base query, the derived column that precomputes it in the equivalent one
+EXPR = Slot('expr')
+# the original table and the derived table precomputing the test expressions
+ORI_TABLE, DERIVED_TABLE = 't0', 't1'
+
+
+def derived_column_name(k: int):
+    """Name of the derived column holding the k-th test expression: c0, c0_1, c0_2, ..."""
+    return 'c0' if k == 0 else f'c0_{k}'
+
+
+class Node:
+    """
+    A query fragment built once from literal text, slots and nested fragments. Both the base and the
+    equivalent query are rendered from it in a single pass, so only the slots differ between them.
+    """
+    __slots__ = ('parts',)
+
+    def __init__(self, *parts):
+        self.parts = parts
+
+    def leaves(self, out: list = None):
+        out = [] if out is None else out
+        for part in self.parts:
+            if isinstance(part, Node):
+                part.leaves(out)
+            else:
+                out.append(part)
+        return out
+
+    def render(self, base: dict, equal: dict):
+        """Renders the base and the equivalent text, base and equal map every slot to its text on that side."""
+        base_parts, equal_parts = [], []
+        for leaf in self.leaves():
+            if isinstance(leaf, Slot):
+                base_parts.append(base[leaf])
+                equal_parts.append(equal[leaf])
+            else:
+                leaf = str(leaf)
+                base_parts.append(leaf)
+                equal_parts.append(leaf)
+        return ''.join(base_parts), ''.join(equal_parts)
+
+    def text(self, mapping: dict):
+        """Renders one side only, mapping maps every slot to its text."""
+        return ''.join(mapping[leaf] if isinstance(leaf, Slot) else str(leaf) for leaf in self.leaves())
+
+    def split(self, mapping: dict, slot: Slot):
+        """Renders one side, except for slot: returns the texts between its occurrences."""
+        pieces, parts = [], []
+        for leaf in self.leaves():
+            if leaf == slot:
+                pieces.append(''.join(parts))
+                parts = []
+            else:
+                parts.append(mapping[leaf] if isinstance(leaf, Slot) else str(leaf))
+        pieces.append(''.join(parts))
+        return pieces
+
+    def template(self):
+        """The text with the slots left as {table} and {expr}, the same for all pairs built from the same tree."""
+        return ''.join(repr(leaf) if isinstance(leaf, Slot) else str(leaf) for leaf in self.leaves())
+
+    def __eq__(self, other):
+        return isinstance(other, Node) and self.template() == other.template()
+
+    def __hash__(self):
+        return hash(self.template())
+
+
+def join(sep: str, items: list):
+    """Joins fragments with a literal separator, like str.join."""
+    parts = []
+    for i, item in enumerate(items):
+        if i:
+            parts.append(sep)
+        parts.append(item)
+    return Node(*parts)
+
+
+def parse(text: str, slots: dict):
+    """
+    Rebuilds the fragment that one side of a pair was rendered from, slots maps the text of every slot on
+    that side to the slot. Slot texts are only matched outside string literals, and names as whole words.
+    """
+    texts = sorted(slots, key=len, reverse=True)
+    parts, start, quote, i = [], 0, None, 0
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == quote:
+                quote = None
+            i += 1
+            continue
+        match = next((t for t in texts if text.startswith(t, i) and _bounded(text, i, i + len(t))), None)
+        if match is not None:
+            parts.extend([text[start:i], slots[match]])
+            i = start = i + len(match)
+            continue
+        if ch in '\'"':
+            quote = ch
+        i += 1
+    parts.append(text[start:])
+    return Node(*parts)
+
+
+def _bounded(text: str, start: int, end: int):
+    # a slot text that starts or ends with a name character must not continue a longer name
+    def is_name(ch):
+        return ch.isalnum() or ch == '_'
+    return not (is_name(text[start]) and start > 0 and is_name(text[start - 1])) and \
+        not (is_name(text[end - 1]) and end < len(text) and is_name(text[end]))
+
+
+class SelectPair:
+    """
+    The base and the equivalent select of a pair, built before the derived column is known. Pairs whose
+    equivalent select only differs in the slots share one tree, which is rendered for both sides at once.
+    """
+    __slots__ = ('base', 'equal')
+
+    def __init__(self, base: Node, equal: Node = None):
+        self.base = base
+        self.equal = base if equal is None else equal
+
+    def render(self, ori_table: str, derived_table: str, expr: str, derived_column: str):
+        base, equal = {TABLE: ori_table, EXPR: expr}, {TABLE: derived_table, EXPR: derived_column}
+        if self.equal is self.base:
+            return self.base.render(base, equal)
+        return self.base.text(base), self.equal.text(equal)
+
+    def bind(self, ori_table: str, derived_table: str, expr: str):
+        """Renders all but the derived column, leaving plain texts that are cheap to send to another process."""
+        return BoundPair(self.base.text({TABLE: ori_table, EXPR: expr}), self.equal.split({TABLE: derived_table}, EXPR))
+
+
+class BoundPair:
+    """A select pair whose tables and expression are rendered, the derived column is filled in between the pieces."""
+    __slots__ = ('base', 'pieces')
+
+    def __init__(self, base: str, pieces: list):
+        self.base = base
+        self.pieces = pieces
+
+    def render(self, ori_table: str, derived_table: str, expr: str, derived_column: str):
+        return self.base, derived_column.join(self.pieces)
@@ -1,5 +1,6 @@
 import random
 from sql.expr_generator import ExprGenerator
+from sql.query import EXPR, TABLE, Node, SelectPair, join
 
 
 class SQLGenerator:
@@ -7,56 +8,47 @@ class SQLGenerator:
         self.database = target
         self.expr_generator = ExprGenerator(target)
 
-    def generate_agg_select(self, ori_table: str, derived_table: str, expr: str, expr_type: str, derived_column, other_column_names: list, other_column_types: list):
+    def build_agg_select(self, expr_type: str, other_column_names: list, other_column_types: list):
         other_cols = f', {", ".join(other_column_names)}' if other_column_names else ''
         group_by = f'GROUP BY {", ".join(other_column_names)}' if other_column_names else ''
-        base_select = f'SELECT {expr}{other_cols} FROM {ori_table}'
-        equal_select = f'SELECT {derived_column}{other_cols} FROM {derived_table}'
-        base_where_cond = self.expr_generator.generate_expr_on_column(ori_table, other_column_names, other_column_types, random.randint(3, 4))
-        equal_where_cond = base_where_cond.replace(ori_table, derived_table)
+        where_cond = self.expr_generator.generate_expr_on_column(TABLE, other_column_names, other_column_types, random.randint(3, 4))
         # having condition is a simple expression, do not use subquery
-        having_cond = self.expr_generator.generate_expr_on_column(ori_table, [expr], [expr_type], 2)
-        equal_having_cond = having_cond.replace(ori_table, derived_table).replace(expr, derived_column)
-        base_select += f' WHERE {base_where_cond} {group_by} HAVING {having_cond}'
-        equal_select += f' WHERE {equal_where_cond} AND ({equal_having_cond})'
-        return base_select, equal_select
+        having_cond = self.expr_generator.generate_expr_on_column(TABLE, [EXPR], [expr_type], 2)
+        base_select = Node('SELECT ', EXPR, f'{other_cols} FROM ', TABLE, ' WHERE ', where_cond, f' {group_by} HAVING ', having_cond)
+        equal_select = Node('SELECT ', EXPR, f'{other_cols} FROM ', TABLE, ' WHERE ', where_cond, ' AND (', having_cond, ')')
+        return SelectPair(base_select, equal_select)
     
-    def generate_func_select(self, ori_table: str, derived_table: str, expr: str, expr_type: str, derived_column, other_column_names: list, other_column_types: list):
-        all_cols = other_column_names + [f'({expr})']
+    def build_func_select(self, expr_type: str, other_column_names: list, other_column_types: list):
+        all_cols = other_column_names + [Node('(', EXPR, ')')]
         all_types = other_column_types + [expr_type]
         # random select subset of all_cols
-        base_select = f'SELECT {", ".join(random.sample(all_cols, random.randint(1, len(all_cols))))} FROM {ori_table}'
-        base_where_cond = self.expr_generator.generate_expr_on_column(ori_table, all_cols, all_types, random.randint(3, 5))
-        base_select += f' WHERE {base_where_cond}'
+        select = Node('SELECT ', join(', ', random.sample(all_cols, random.randint(1, len(all_cols)))), ' FROM ', TABLE)
+        where_cond = self.expr_generator.generate_expr_on_column(TABLE, all_cols, all_types, random.randint(3, 5))
+        select = Node(select, ' WHERE ', where_cond)
         if random.random() < 0.5:
             order_cols = random.sample(all_cols, random.randint(1, len(all_cols)))
             order_dirs = [random.choice(['ASC', 'DESC']) for _ in order_cols]
-            order_clause = f" ORDER BY {', '.join(f'{col} {dir}' for col, dir in zip(order_cols, order_dirs))}"
-            base_select += order_clause
-        equal_select = base_select.replace(ori_table, derived_table).replace(expr, derived_column)
-
-        return base_select, equal_select
+            select = Node(select, ' ORDER BY ', join(', ', [Node(col, f' {dir}') for col, dir in zip(order_cols, order_dirs)]))
+        return SelectPair(select)
     
-    def generate_pred_select(self, ori_table: str, derived_table: str, expr: str, expr_type: str, derived_column, other_column_names: list, other_column_types: list):
-        base_select = f'SELECT {", ".join(random.sample(other_column_names, random.randint(1, len(other_column_names))))} FROM {ori_table}'
+    def build_pred_select(self, expr_type: str, other_column_names: list, other_column_types: list):
+        select = Node(f'SELECT {", ".join(random.sample(other_column_names, random.randint(1, len(other_column_names))))} FROM ', TABLE)
         # use expr as normal column
         if random.random() < 0.3:
-            all_cols = other_column_names + [f'({expr})']
+            all_cols = other_column_names + [Node('(', EXPR, ')')]
             all_types = other_column_types + [expr_type]
-            base_where_cond = self.expr_generator.generate_expr_on_column(ori_table, all_cols, all_types, random.randint(3, 4))
+            where_cond = self.expr_generator.generate_expr_on_column(TABLE, all_cols, all_types, random.randint(3, 4))
         else:
-            base_where_cond = self.expr_generator.generate_expr_on_column(ori_table, other_column_names, other_column_types, random.randint(3, 4))
-            base_where_cond = f'({expr}) {random.choice(["AND", "OR"])} {base_where_cond}'
-        base_select += f' WHERE {base_where_cond}'
+            where_cond = self.expr_generator.generate_expr_on_column(TABLE, other_column_names, other_column_types, random.randint(3, 4))
+            where_cond = Node('(', EXPR, f') {random.choice(["AND", "OR"])} ', where_cond)
+        select = Node(select, ' WHERE ', where_cond)
         
         if random.random() < 0.5:
             order_cols = random.sample(other_column_names, random.randint(1, len(other_column_names)))
             order_dirs = [random.choice(['ASC', 'DESC']) for _ in order_cols]
             order_clause = f" ORDER BY {', '.join(f'{col} {dir}' for col, dir in zip(order_cols, order_dirs))}"
-            base_select += order_clause
-        equal_select = base_select.replace(ori_table, derived_table).replace(expr, derived_column)
-
-        return base_select, equal_select
+            select = Node(select, order_clause)
+        return SelectPair(select)
 
     def generate_drop(self, table: str):
         return f'DROP TABLE IF EXISTS {table}'
@@ -69,8 +61,19 @@ class SQLGenerator:
             return f'CREATE TABLE {table} ({columns})'
     
     def generate_insert(self, table: str, column_types: list, column_names: list):
+        return self.generate_bulk_insert(table, column_names, [self.generate_insert_values(column_types)])
+
+    def generate_insert_values(self, column_types: list):
         values = ", ".join([str(self.expr_generator.generate_random_value(col_type)) for col_type in column_types])
-        return f'INSERT INTO {table} ({", ".join(column_names)}) VALUES ({values})'
+        return f'({values})'
+
+    def generate_insert_rows(self, column_types: list, row_cnt: int):
+        """Values of row_cnt rows, generated column by column in batches."""
+        columns = [self.expr_generator.generate_random_values(col_type, row_cnt) for col_type in column_types]
+        return [f'({", ".join([str(value) for value in row])})' for row in zip(*columns)]
+
+    def generate_bulk_insert(self, table: str, column_names: list, rows: list):
+        return f'INSERT INTO {table} ({", ".join(column_names)}) VALUES {", ".join(rows)}'
 
     def generate_set(self, config_list: list):
         if self.database in ['mysql', 'mariadb']:
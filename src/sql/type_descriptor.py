@@ -0,0 +1,70 @@
+import random
+
+
+def split_args(text: str):
+    """Splits type arguments at the commas outside parentheses and quotes."""
+    args, depth, quote, start = [], 0, None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            args.append(text[start:i].strip())
+            start = i + 1
+    if text.strip():
+        args.append(text[start:].strip())
+    return args
+
+
+class TypeDescriptor:
+    """
+    A column type string parsed once: the upper-case type name, its arguments (length, enum values or
+    element types), the target dialect and the value generator bound to them by ExprGenerator.describe.
+    """
+    __slots__ = ('type', 'dialect', 'name', 'args', 'length', 'values', 'elements', 'batch_kind', 'generate')
+
+    def __init__(self, type: str, dialect: str):
+        self.type = type
+        self.dialect = dialect
+        start, end = type.find('('), type.rfind(')')
+        if start >= 0 and end > start:
+            self.name = type[:start].strip().upper()
+            self.args = split_args(type[start + 1:end])
+        else:
+            self.name = type.strip().upper()
+            self.args = []
+        # length of string, binary and vector types, 10 if the type has none
+        self.length = int(self.args[0]) if self.args and self.args[0].isdigit() else 10
+        self.values = [arg.strip("'\"") for arg in self.args]
+        # descriptors of the element types of Array, Tuple and Map
+        self.elements = []
+        # kind of array generator used by ExprGenerator.generate_random_values, None to generate value by value
+        self.batch_kind = None
+        # generate(depth, max_depth) returns a random value of the type
+        self.generate = None
+
+    def instantiate(self):
+        """
+        Returns a concrete column type for a seed type: ENUM gets random values, CHAR, VARCHAR, VARBINARY
+        and BINARY a random length and VECTOR a random dimension. Any other type is returned unchanged.
+        """
+        if self.args:
+            return self.type
+        if self.name.startswith('ENUM'):
+            enum_size = random.randint(2, 5)
+            enum_values = [f"'val{j}'" for j in range(enum_size)]
+            return f"ENUM({','.join(enum_values)})"
+        if self.name.startswith(('CHAR', 'VAR')) or self.name == 'BINARY':
+            return f'{self.type}({random.randint(1, 30)})'
+        if self.name == 'VECTOR':
+            return f'VECTOR({random.randint(1, 10)})'
+        return self.type
+
+    def __repr__(self):
+        return f'TypeDescriptor({self.type!r}, {self.dialect!r})'
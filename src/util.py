@@ -1,14 +1,22 @@
 import os
+import re
+import json
+import hashlib
+import functools
 import importlib
 import configparser
 from typing import List
 from loguru import logger
+from config import config
 from conn.base import Result
+from conn.pool import SchemaPool
 import shutil
 
 
 ################# database operation #################
-def get_conn(target: str, database: str):
+@functools.lru_cache(maxsize=None)
+def get_conn_config(target: str):
+    """Parses the connection settings of the target and resolves its connector class, once per process."""
     conn_config = configparser.ConfigParser()
     conn_config.read('./config/conn.ini')
 
@@ -17,7 +25,6 @@ def get_conn(target: str, database: str):
         'password': conn_config[target]['password'],
         'host': conn_config[target]['host'],
         'port': int(conn_config[target]['port']),
-        'database': database
     }
 
     # Get blacklist from config
@@ -26,12 +33,25 @@ def get_conn(target: str, database: str):
         # Convert string representation of list to actual list
         res_blacklist = eval(res_blacklist)
     db_config['res_blacklist'] = res_blacklist  # Pass blacklist to connection
-    
+    db_config['statement_timeout'] = config.statement_timeout
+
     conn_class_path = conn_config[target]['conn']
     module_name, class_name = conn_class_path.rsplit('.', 1)
     module = importlib.import_module(module_name)
     conn_class = getattr(module, class_name)
-    return conn_class(**db_config)
+    return conn_class, db_config
+
+
+def get_pool(target: str, prefix: str, size: int):
+    conn_class, db_config = get_conn_config(target)
+    return SchemaPool(conn_class, db_config, prefix, size)
+
+
+################# random operation #################
+def derive_seed(seed: int, *keys) -> int:
+    """Derives an independent seed for a sub-stream (e.g. a worker) from the campaign seed."""
+    digest = hashlib.sha256(repr((seed,) + keys).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
 
 
 ################# file operation #################
@@ -56,24 +76,12 @@ def read_file(path: str):
     return lines
 
 
-def log_res(sz: str, op: str, res1: List[Result], res2: List[Result], insert_res: List[Result], name: str, out_path: str):
-
-    def sql_to_file(sql, filepath: str):
-        dir_path = os.path.join(out_path, f'{op}-{sz}')
-        os.makedirs(dir_path, exist_ok=True)  
-        full_path = os.path.join(dir_path, filepath)
-
-        with open(full_path, "w", encoding='utf-8') as file:
-            for s in sql:
-                file.write(s)
-                if not s.endswith(";"):
-                    file.write(";")
-                file.write("\n")
-
-    if op == '/':
-        op = 'div'
+def collect_res(sz: int, op: str, res1: List[Result], res2: List[Result], insert_res: List[Result], name: str):
+    """Compares the recorded result pairs and returns the finding to report, or None if all pairs agree."""
     ori_sql_list, dest_sql_list, insert_sql_list = [], [], [r.sql for r in insert_res]
     error = []
+    error_codes = []
+    diffs = []
     diff = False
     for i in range(len(res1)):
         r1, r2 = res1[i], res2[i]
@@ -90,15 +98,114 @@ def log_res(sz: str, op: str, res1: List[Result], res2: List[Result], insert_res
             r2.print_log("error")
             error.extend(r1.get_res())
             error.extend(r2.get_res())
+            error_codes.append([r1.error_code, r2.error_code])
+            diffs.append([diff_shape(r1, r2), query_skeleton(r1.sql)])
+
+    if not diff:
+        return None
+    return {
+        'name': name,
+        'op': op,
+        'sz': sz,
+        'errors': error,
+        'error_codes': error_codes,
+        'diffs': diffs,
+        'create_sql': ori_sql_list[0],
+        'insert_sqls': insert_sql_list,
+        'derived_sql': dest_sql_list[0],
+        'pairs': [[s1, s2] for s1, s2 in zip(ori_sql_list[1:], dest_sql_list[1:])],
+    }
+
+
+def collect_latency(sz: int, op: str, create_res: Result, derived_res: Result, insert_res: List[Result], base_select: str,
+                    equal_select: str, timings: dict, name: str):
+    """Builds the finding of a select pair with equal results whose latencies diverge, timings holds the runs of each side."""
+    base, equal = min(timings['base']), min(timings['equal'])
+    slower = 'base' if base > equal else 'equal'
+    return {
+        'name': name,
+        'op': op,
+        'sz': sz,
+        'errors': [f"-- latency: base {base:.6f}s, equal {equal:.6f}s, fastest of {len(timings['base'])} runs, "
+                   f"ratio {max(base, equal) / max(min(base, equal), 1e-9):.1f}"],
+        'error_codes': [['latency', 'latency']],
+        'diffs': [[f'{slower} slower', query_skeleton(base_select)]],
+        'create_sql': create_res.sql,
+        'insert_sqls': [r.sql for r in insert_res],
+        'derived_sql': derived_res.sql,
+        'pairs': [[base_select, equal_select]],
+        'latency': timings,
+    }
+
+
+def _result_kind(res: Result):
+    if res.is_error():
+        return f'error {res.error_code}'
+    return 'update' if res.update_num is not None else 'result'
+
+
+def diff_shape(r1: Result, r2: Result):
+    """Describes how two results differ, independently of the random data."""
+    if r1.is_error() or r2.is_error() or r1.update_num is not None or r2.update_num is not None:
+        return f'{_result_kind(r1)} / {_result_kind(r2)}'
+    if r1.row_cnt != r2.row_cnt:
+        return 'rows <' if r1.row_cnt < r2.row_cnt else 'rows >'
+    return 'values'
+
+
+def query_skeleton(sql: str):
+    """Reduces a query to the clauses it uses, dropping the randomly generated expressions, columns and literals."""
+    sql = re.sub(r"'[^']*'", "''", sql)
+    words = re.findall(r'\b(?:SELECT|WHERE|GROUP BY|HAVING|ORDER BY|CASE|IN)\b', sql)
+    skeleton = list(dict.fromkeys(words))
+    if words.count('SELECT') > 1:
+        skeleton.append('SUBQUERY')
+    return ' '.join(skeleton)
+
+
+def normalize_type(column_type: str):
+    """Drops the length, precision and enumerated values of a column type, e.g. DECIMAL(10, 2) -> DECIMAL."""
+    column_type = re.sub(r"\((?:\s*'[^']*'\s*,?)+\)", '', column_type)
+    return re.sub(r'\([\d\s,]*\)', '', column_type).strip().upper()
+
+
+def finding_signature(finding: dict, column_types: list):
+    """
+    Fingerprints a discrepancy from its op, the normalized types of the test columns, how the results
+    differ and the clauses of the differing queries, so repeated hits of the same bug share a signature.
+    """
+    description = {
+        'op': finding['op'],
+        'types': [normalize_type(t) for t in column_types[:finding['sz']]],
+        'diffs': finding['diffs'],
+    }
+    description = json.dumps(description, sort_keys=True)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest(), description
+
+
+def finding_to_sql(finding: dict):
+    """Lays out a finding as the statements of its reproducer script, preceded by the differing results."""
+    log_sql = []
+    log_sql.extend(finding['errors'])
+    log_sql.append(finding['create_sql'])
+    log_sql.extend(finding['insert_sqls'])
+    log_sql.append(finding['derived_sql'])
+    for s1, s2 in finding['pairs']:
+        log_sql.append(s1)
+        log_sql.append(s2)
+    return log_sql
+
+
+def finding_path(out_path: str, finding: dict):
+    op = 'div' if finding['op'] == '/' else finding['op']
+    return os.path.join(out_path, f"{op}-{finding['sz']}", f"{finding['name']}.sql")
+
 
-    if diff:
-        log_sql = []
-        log_sql.extend(error)
-        log_sql.append(ori_sql_list[0])
-        log_sql.extend(insert_sql_list)
-        log_sql.append(dest_sql_list[0])
-
-        for s1, s2 in zip(ori_sql_list[1:], dest_sql_list[1:]):
-            log_sql.append(s1)
-            log_sql.append(s2)
-        sql_to_file(log_sql, f'{name}.sql')
\ No newline at end of file
+def sql_to_file(sql: List[str], full_path: str):
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "w", encoding='utf-8') as file:
+        for s in sql:
+            file.write(s)
+            if not s.endswith(";"):
+                file.write(";")
+            file.write("\n")
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import sqlite3
+from util import normalize_type
+
+
+class ValidityCache:
+    """
+    On-disk record of (op, column types) combinations that are invalid on a given server version.
+
+    The cache is a SQLite database shared by all runs and workers. A combination is only considered
+    invalid after failing min_failures times without ever succeeding, because some failures depend on
+    the random data (e.g. an overflow) rather than on the types. Column types are recorded without their
+    random lengths and enumerated values, so all VARCHAR or ENUM columns share one combination.
+    """
+
+    def __init__(self, path: str, target: str, version: str, min_failures: int):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.target = target
+        self.version = version
+        self.min_failures = min_failures
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS combination (
+                                target TEXT NOT NULL,
+                                version TEXT NOT NULL,
+                                op TEXT NOT NULL,
+                                column_types TEXT NOT NULL,
+                                failures INTEGER NOT NULL DEFAULT 0,
+                                valid INTEGER NOT NULL DEFAULT 0,
+                                error_code TEXT,
+                                error_msg TEXT,
+                                updated REAL,
+                                PRIMARY KEY (target, version, op, column_types))''')
+        self.db.commit()
+
+    def _key(self, op: str, column_types):
+        return self.target, self.version, op, json.dumps([normalize_type(t) for t in column_types])
+
+    def is_invalid(self, op: str, column_types) -> bool:
+        row = self.db.execute('SELECT failures, valid FROM combination '
+                              'WHERE target = ? AND version = ? AND op = ? AND column_types = ?',
+                              self._key(op, column_types)).fetchone()
+        return row is not None and row[1] == 0 and row[0] >= self.min_failures
+
+    def add_invalid(self, op: str, column_types, error_code, error_msg: str):
+        with self.db:
+            self.db.execute('INSERT INTO combination (target, version, op, column_types, failures, error_code, error_msg, updated) '
+                            'VALUES (?, ?, ?, ?, 1, ?, ?, ?) '
+                            'ON CONFLICT (target, version, op, column_types) DO UPDATE SET '
+                            'failures = failures + 1, error_code = excluded.error_code, '
+                            'error_msg = excluded.error_msg, updated = excluded.updated',
+                            self._key(op, column_types) + (error_code, error_msg, time.time()))
+
+    def add_valid(self, op: str, column_types):
+        with self.db:
+            self.db.execute('UPDATE combination SET valid = 1, updated = ? '
+                            'WHERE target = ? AND version = ? AND op = ? AND column_types = ? AND valid = 0',
+                            (time.time(),) + self._key(op, column_types))
+
+    def close(self):
+        self.db.close()
+
+
+class DerivedTypeCache:
+    """
+    On-disk record of the derived column type last seen for an (op, test column types) combination.
+
+    Workers record the types they resolve, producers read them to generate the select pairs of a case
+    before its derived table exists. The types are only hints, so they are not tied to a server version.
+    """
+
+    def __init__(self, path: str, target: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.target = target
+        self.known = {}
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS derived_type (
+                                target TEXT NOT NULL,
+                                op TEXT NOT NULL,
+                                column_types TEXT NOT NULL,
+                                derived_type TEXT NOT NULL,
+                                updated REAL,
+                                PRIMARY KEY (target, op, column_types))''')
+        self.db.commit()
+
+    def get(self, op: str, column_types):
+        key = (self.target, op, json.dumps(list(column_types)))
+        if key not in self.known:
+            row = self.db.execute('SELECT derived_type FROM derived_type WHERE target = ? AND op = ? AND column_types = ?',
+                                  key).fetchone()
+            # misses are not remembered, the type may be recorded by a worker later
+            if row is None:
+                return None
+            self.known[key] = row[0]
+        return self.known[key]
+
+    def add(self, op: str, column_types, derived_type: str):
+        key = (self.target, op, json.dumps(list(column_types)))
+        if self.known.get(key) == derived_type:
+            return
+        self.known[key] = derived_type
+        with self.db:
+            self.db.execute('INSERT INTO derived_type (target, op, column_types, derived_type, updated) VALUES (?, ?, ?, ?, ?) '
+                            'ON CONFLICT (target, op, column_types) DO UPDATE SET '
+                            'derived_type = excluded.derived_type, updated = excluded.updated',
+                            key + (derived_type, time.time()))
+
+    def close(self):
+        self.db.close()